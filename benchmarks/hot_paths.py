@@ -0,0 +1,101 @@
+"""Microbenchmarks for the game rule functions that run on every turn.
+
+Run from the project root with `python -m benchmarks.hot_paths`. Each benchmark is timed
+against a mid-game position and compared with the numbers stored in benchmarks/baseline.json.
+Pass --save to store the current numbers as the new baseline.
+"""
+
+import argparse
+import json
+import os
+import random
+import timeit
+from game.deck import make_deck
+from game.game import Game
+from game.payment import Payment
+from game.player import Player
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def mid_game():
+    """Returns a game of three players partway through: 24 of the 40 cards have been dealt
+    out, two donkeys have been played and some money has changed hands"""
+
+    rng = random.Random(1)
+    game = Game()
+    for i in range(3):
+        player = Player(None, str(i))
+        player.name = f'player {i}'
+        game.add_player(player)
+    deck = make_deck()
+    rng.shuffle(deck)
+    for i in range(24):
+        game.players[i % 3].add_card(deck.pop())
+    game.deck = deck
+    for player in game.players:
+        for _ in range(2):
+            player.wallet.donkey_played()
+    game.players[0].accept_payment(game.players[1].wallet.create_payment({'tens': 2, 'fifties': 1}))
+    return game
+
+def benchmarks():
+    """Returns a dict of benchmark name to a function running one call of it"""
+
+    game = mid_game()
+    player, opponent = game.players[0], game.players[1]
+    wallet = player.wallet
+    payment = Payment(zeros=1, tens=2, fifties=1)
+    names = [c.name for c in player.cards]
+    # a card that doesn't complete a set when added back to the hand
+    card = next(c for c in player.cards if names.count(c.name) < 3)
+    shared = next(c.name for c in player.cards if c.name in {o.name for o in opponent.cards})
+
+    def add_and_remove_card():
+        player.add_card(card)
+        player.get_card_by_name(card.name)
+
+    return {
+        'Wallet.total': lambda: wallet.total,
+        'Wallet.count': lambda: wallet.count,
+        'Wallet.check_payment': lambda: wallet.check_payment(payment),
+        'Player.verify_bid': lambda: player.verify_bid(150),
+        'Player.add_card + get_card_by_name': add_and_remove_card,
+        'Game.has_legal_challenge': lambda: game.has_legal_challenge(player),
+        'Game.verify_challenge': lambda: game.verify_challenge(player, opponent, shared),
+        'Game.update_global_state': game.update_global_state,
+    }
+
+def measure(func, repeat=5):
+    """Returns the best time of repeat runs of func, in nanoseconds per call"""
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game rule hot paths')
+    parser.add_argument('--save', action='store_true', help='store these results as the baseline')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name, func in benchmarks().items():
+        results[name] = round(measure(func), 1)
+        line = f'{name:<40} {results[name]:>10.1f} ns'
+        if name in baseline:
+            change = (results[name] - baseline[name]) / baseline[name] * 100
+            line += f'   baseline {baseline[name]:>10.1f} ns  ({change:+.1f}%)'
+        print(line)
+
+    if args.save:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'saved baseline to {BASELINE_PATH}')
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,38 @@
-
-const websocket = new WebSocket('ws://127.0.0.1:9876/');
+let websocket
 const feed = document.getElementById('feed');
 
+// messages received in this session, numbered the way the server numbers them, so a dropped
+// connection can resume with the first message it missed
+let received = 0
+let resumeFrom = 0
+let reconnecting = false
+// until a new connection is known to resume the session or start a new one, its messages are
+// counted separately, so a connection lost before then leaves the session count alone
+let joining = false
+let joiningReceived = 0
+
+const connect = () => {
+  websocket = new WebSocket('ws://127.0.0.1:9876/');
+  websocket.onmessage = onMessage
+  websocket.onopen = () => {
+    joining = true
+    joiningReceived = 0
+    resumeFrom = reconnecting ? received : 0
+    if (reconnecting) {
+      sendUsername()
+    }
+  }
+  // when the connection drops mid game, reconnect and carry on where it left off
+  websocket.onclose = () => {
+    if (sessionStorage.getItem('resumeToken')) {
+      reconnecting = true
+      setTimeout(connect, 1000)
+    }
+  }
+}
+
 // update feed for all events received
-websocket.onmessage = event => {
+const onMessage = event => {
   const msg = document.createElement('li');
   const msgContent = document.createTextNode(event.data)
   msg.appendChild(msgContent)
@@ -12,19 +41,50 @@ websocket.onmessage = event => {
   if (event.data.type === 'bid') {
     currentBid.textContent = event.data.payload.bid
   }
+
+  const data = JSON.parse(event.data)
+  if (data.type === 'resumed') {
+    joining = false
+    received = data.payload.next
+    return
+  }
+  if (joining) {
+    joiningReceived += 1
+  } else {
+    received += 1
+  }
+  // kept for this tab, so reloading it after a server restart takes back the same seat
+  if (data.type === 'player-id') {
+    if (joining) {
+      // not resumed, so the messages on this connection start a new count
+      joining = false
+      received = joiningReceived
+    }
+    sessionStorage.setItem('playerId', data.payload.player_id)
+    sessionStorage.setItem('resumeToken', data.payload.resume_token)
+  }
+  if (data.type === 'game-over') {
+    sessionStorage.removeItem('resumeToken')
+  }
 }
 
 // name input
 const username = document.getElementById('username');
 const submitUsername = document.getElementById('name-submit');
-submitUsername.onclick = () => {
+const sendUsername = () => {
   websocket.send(JSON.stringify({
     "type": "username",
     "payload": {
-      "username": username.value
+      "username": username.value,
+      "player_id": sessionStorage.getItem('playerId'),
+      "resume_token": sessionStorage.getItem('resumeToken'),
+      "received": resumeFrom
     }
   }))
 }
+submitUsername.onclick = sendUsername
+
+connect()
 
 // Start turn controls
 const auctionButton = document.getElementById('auctionButton');
@@ -0,0 +1,113 @@
+"""Server-side bot players, for filling seats that no person has taken.
+
+A bot is a Player whose LocalClient hands each message to a BotAgent, so it plays in the same
+game as websocket clients without a socket of its own.
+"""
+
+import random
+from uuid import uuid4
+from .deck import CARDS, card_ids
+from .local import LocalClient, SimpleAgent
+from .player import Player
+
+# value of the most valuable animal, which bots are willing to spend most of their money on
+TOP_VALUE = 1000
+
+
+class BotAgent(SimpleAgent):
+    """Agent for server-side bots. Bids up to a share of its money that grows with the animal's
+    value, with how many of it the bot holds and with whether an opponent is one short of a
+    set, and as auctioneer buys the animal itself when the winning bid is within that share.
+    Challenges for the most valuable animal it shares, offering more money for more valuable
+    animals, and always keeps some money back."""
+
+    # share of its money a bot never bids or offers
+    reserve = 0.2
+
+    def __init__(self, name, rng=None):
+        super().__init__(name, rng)
+        # animal the bot is being challenged for, or is challenging for
+        self.challenged_for = None
+
+    def __call__(self, msg_type, payload):
+        if msg_type == 'message' and isinstance(payload, dict):
+            self.on_message(payload.get('message', ''))
+        return super().__call__(msg_type, payload)
+
+    def on_bid(self, payload):
+        """Raises the bid up to the bot's limit, or as auctioneer offers to match it"""
+
+        if payload['bid'] == 0:
+            self.auctioneer = payload['player']
+        if not self.card or not self.state or payload['player'] == self.name:
+            return None
+        limit = self.bid_limit(self.card['name'], self.card['value'])
+        if self.name == self.auctioneer:
+            # the auctioneer may buy the animal for the winning bid, and the last bid
+            # heard is the winning one
+            if 0 < payload['bid'] <= limit:
+                return 'auctioneer-bid', {'amount': payload['bid']}
+            return None
+        bid = payload['bid'] + 10
+        if bid > limit:
+            return None
+        return 'bid', {'amount': bid}
+
+    def on_message(self, message):
+        """Notes the animal when another player challenges the bot"""
+
+        if f'challenged {self.name} for' in message:
+            animal = message.split(' for ', 1)[1].split(' with ', 1)[0]
+            # 'a cow' or 'all the cows'
+            self.challenged_for = animal[2:] if animal.startswith('a ') else animal[8:-1]
+
+    def bid_limit(self, animal, value):
+        """Returns the most the bot will pay for one more of animal"""
+
+        global_state = self.state['global_state']
+        held = self.count(self.name, animal)
+        share = value / TOP_VALUE * (1 + held) / 2
+        if any(self.count(name, animal) == 3 for name in global_state['players'] if name != self.name):
+            # stop an opponent completing a set
+            share += 0.25
+        return int(self.wallet_total() * min(share, 1 - self.reserve))
+
+    def count(self, name, animal):
+        """Returns how many of animal the named player holds, as of the latest state"""
+
+        return sum(c[0] == animal for c in self.state['global_state'][name]['cards'])
+
+    def choose_challenge(self):
+        """Picks the most valuable animal held by both the bot and an opponent, preferring
+        the opponent holding fewest of it"""
+
+        global_state = self.state['global_state']
+        mine = {c[0]: c[1] for c in global_state[self.name]['cards']}
+        options = [
+            (value, -self.count(name, animal), name, animal)
+            for name in global_state['players'] if name != self.name
+            for animal, value in mine.items() if self.count(name, animal)
+        ]
+        _, _, name, animal = max(options)
+        self.challenged_for = animal
+        return {'player': name, 'card': animal}
+
+    def choose_payment(self, total):
+        """Pays at least total, or when offering money in a challenge, a share of the bot's
+        money that grows with the value of the animal"""
+
+        if total == 0 and self.challenged_for:
+            value = CARDS[card_ids[self.challenged_for]].value
+            self.challenged_for = None
+            share = min(value / TOP_VALUE / 2 + 0.1, 1 - self.reserve)
+            total = int(self.wallet_total() * share) // 10 * 10
+        return super().choose_payment(total)
+
+
+def create_bot(name, rng=None):
+    """Returns a bot Player named name, ready to be added to a game"""
+
+    player = Player(None, str(uuid4()), client=LocalClient(BotAgent(name, rng or random.Random())))
+    player.name = name
+    player.is_bot = True
+    return player
@@ -1,75 +1,369 @@
 import asyncio
 import json
-from collections import deque
-from websockets.exceptions import ConnectionClosedError
+import time
+from collections import defaultdict, deque
+from functools import partial
+from itertools import count
+from websockets.exceptions import ConnectionClosed, ConnectionClosedError
+from . import codec, metrics, tracing
+
+# messages waiting to be written to a client before its full queue policy applies
+SEND_QUEUE_SIZE = 64
+# what happens when a message is sent to a client whose send queue is full. 'coalesce' drops
+# queued state messages that a newer one makes stale, and disconnects the client only if that
+# frees no room; 'disconnect' disconnects the client straight away
+FULL_QUEUE_POLICIES = ('coalesce', 'disconnect')
+# types of message the game reads from clients; messages of any other type are dropped
+READ_TYPES = frozenset((
+    'bid', 'auctioneer-bid', 'response', 'payment', 'challenge', 'username', 'state-ack', 'resync'
+))
+# most unread messages of one type kept, the oldest being dropped to make room for a new one
+MSG_QUEUE_SIZE = 32
+# most recently sent messages kept for replaying to a client that resumes its session. No more
+# than half of a client's send queue is replayed, leaving room for the messages that follow.
+REPLAY_BUFFER_SIZE = SEND_QUEUE_SIZE // 2
 
 
 class Client:
-    """Class to manage network connection between Player and remote client"""
+    """Class to manage network connection between Player and remote client.
+    Sent messages go into a bounded queue written to the socket by the client's own writer task,
+    so the game never waits on one client's connection.
+    param send_queue_size: most messages waiting to be written before full_queue_policy applies
+    param full_queue_policy: one of FULL_QUEUE_POLICIES
+    param resume_time: seconds a client whose connection drops has to resume its session on a new
+    connection, see resume, before it counts as disconnected; 0 to disconnect it straight away
+    param replay_buffer_size: most sent messages kept for replaying when the client resumes
+    """
+
+    # set by Game when the game is traced
+    tracer = tracing.NULL_TRACER
+    trace_row = 0
 
-    def __init__(self, websocket):
+    def __init__(self, websocket, send_queue_size=SEND_QUEUE_SIZE, full_queue_policy='coalesce',
+            resume_time=0, replay_buffer_size=REPLAY_BUFFER_SIZE):
+        if full_queue_policy not in FULL_QUEUE_POLICIES:
+            raise ValueError(f'unknown full queue policy {full_queue_policy!r}')
         self._websocket = websocket
-        self.msg_queue = deque()
+        self.send_queue_size = send_queue_size
+        self.full_queue_policy = full_queue_policy
+        # (msg_type, data) of messages waiting for the writer task, which only runs while it has work
+        self._send_queue = deque()
+        self._writer = None
+        self.disconnected = False
+        self.resume_time = resume_time
+        # (msg_type, data) of the latest messages sent, the last of which is numbered _sent_count - 1
+        self._sent = deque(maxlen=replay_buffer_size if resume_time else 0)
+        self._sent_count = 0
+        # timer that disconnects the client unless it resumes, set while its connection is down
+        self._resume_timer = None
+        # clients opening their connection with the binary subprotocol are sent binary frames
+        if getattr(websocket, 'subprotocol', None) == codec.SUBPROTOCOL:
+            self.wire_format = 'binary'
+        else:
+            self.wire_format = 'json'
+        # incoming messages are routed by type, so a message of one type never
+        # has to be discarded while waiting for another
+        self._msgs_by_type = defaultdict(partial(deque, maxlen=MSG_QUEUE_SIZE))
+        # futures belonging to coroutines blocked in wait_for_msg, keyed by type
+        self._waiters = defaultdict(deque)
+        # arrival order, used by get_msg to return the oldest message of any type
+        self._msg_counter = count()
+        metrics.clients.add(self)
+
+    @property
+    def queue_depth(self):
+        """Returns the number of received messages not yet read"""
+
+        return sum(len(queue) for queue in self._msgs_by_type.values())
+
+    @property
+    def send_queue_depth(self):
+        """Returns the number of sent messages not yet written to the socket"""
+
+        return len(self._send_queue)
+
+    @property
+    def suspended(self):
+        """True while the client's connection is down and it may still resume"""
+
+        return self._resume_timer is not None
 
     async def handle_msgs(self, is_complete):
-        """Asynchronously receives incoming messages for the lifetime of a single client and forwards them to msg_queue.
+        """Asynchronously receives incoming messages for the lifetime of a single client and routes them by type.
         This method must be running for any other methods on this class to work.
-        All messages placed in queue are dicts. Continues receiving messages until is_complete is True"""
+        All messages routed are dicts. Continues receiving messages until is_complete is True"""
     
+        websocket = self._websocket
         try:
-            async for message in self._websocket:
-                self.msg_queue.append(json.loads(message))
+            async for message in websocket:
+                try:
+                    if isinstance(message, bytes):
+                        msg = codec.decode(message)
+                    else:
+                        msg = json.loads(message)
+                except (codec.CodecError, json.JSONDecodeError):
+                    # one bad frame mustn't stop the client's other messages being read
+                    metrics.malformed_messages.inc()
+                    continue
+                self._route_msg(msg)
+            # the loop also ends when the client closes the connection cleanly
+            if getattr(websocket, 'closed', False):
+                self._connection_lost(websocket)
         except ConnectionClosedError:
-            raise ClientDisconnectError
+            metrics.disconnects.inc()
+            self._connection_lost(websocket)
+            if self.disconnected:
+                raise ClientDisconnectError
+
+    def _route_msg(self, msg):
+        """Hands msg to the oldest coroutine waiting on its type, or queues it if nobody is waiting.
+        Drops messages of a type the game never reads."""
+
+        msg_type = msg.get('type') if isinstance(msg, dict) else None
+        if not isinstance(msg_type, str) or msg_type not in READ_TYPES:
+            metrics.messages_dropped.inc()
+            return
+        metrics.messages_received.inc(msg_type)
+        waiters = self._waiters.get(msg_type)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(msg)
+                return
+        self._msgs_by_type[msg_type].append((next(self._msg_counter), msg))
+
+    def _fail_waiters(self, exc):
+        """Wakes every waiting coroutine with exc"""
+
+        for waiters in self._waiters.values():
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_exception(exc)
 
     async def send_msg(self, msg, msg_type):
         """Public method to send generic message (msg) of type msg_type"""
         
-        await self._send_msg({
+        metrics.messages_sent.inc(msg_type)
+        await self.send_encoded(self.encode_msg(msg, msg_type), msg_type)
+
+    def encode_msg(self, msg, msg_type):
+        """Returns the JSON string, or for binary clients the binary frame, sent over the wire
+        for a message (msg) of type msg_type. Lets a message going to several clients with
+        the same wire_format be serialized once."""
+
+        if self.wire_format == 'binary':
+            return codec.encode(msg_type, msg)
+        return json.dumps({
             'type': msg_type,
             'payload': msg
         })
 
+    async def send_encoded(self, data, msg_type=None):
+        """Queues a message already serialized by encode_msg to be written to the socket, and returns
+        without waiting for it to be written. Raises ClientDisconnectError if the client has
+        disconnected, or is disconnected because its send queue is full. While the client is
+        suspended the message is only kept for replaying."""
+
+        if self.disconnected:
+            raise ClientDisconnectError
+        entry = (msg_type, data)
+        self._sent.append(entry)
+        self._sent_count += 1
+        if self.suspended:
+            return
+        queue = self._send_queue
+        if len(queue) >= self.send_queue_size:
+            if self.full_queue_policy == 'coalesce':
+                self._coalesce_states(msg_type)
+            if len(queue) >= self.send_queue_size:
+                self._disconnect_slow_client()
+                raise ClientDisconnectError
+        queue.append(entry)
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_queued())
+
     async def _send_msg(self, msg):
         """Accepts a dictionary and sends a JSON string"""
+
+        metrics.messages_sent.inc(msg.get('type'))
+        await self.send_encoded(json.dumps(msg), msg.get('type'))
+
+    async def flush(self, timeout=None):
+        """Waits until every queued message has been written, or for at most timeout seconds"""
+
+        while self._writer is not None:
+            done, _ = await asyncio.wait([self._writer], timeout=timeout)
+            if not done:
+                return
+
+    async def _write_queued(self):
+        """Writes queued messages to the socket in order, until the queue is empty"""
+
+        queue = self._send_queue
+        websocket = self._websocket
         try:
-            await self._websocket.send(json.dumps(msg))
-        except ConnectionClosedError:
-            raise ClientDisconnectError
+            while queue:
+                _, data = queue.popleft()
+                start = time.perf_counter()
+                with self.tracer.span('send', self.trace_row):
+                    await websocket.send(data)
+                metrics.send_seconds.observe(time.perf_counter() - start)
+        except ConnectionClosed:
+            self._connection_lost(websocket)
+        finally:
+            # a writer cancelled by resume may finish after its replacement has started
+            if self._writer is asyncio.current_task():
+                self._writer = None
+
+    def _coalesce_states(self, msg_type):
+        """Drops queued state messages made stale by a newer one: all of them when msg_type is
+        a state message, else all but the newest. Each state message is either a full state or
+        a delta from a state the client has acknowledged, so any one of them can be left out."""
+
+        queue = self._send_queue
+        stale = [i for i, (queued_type, _) in enumerate(queue) if queued_type == 'state']
+        if msg_type != 'state':
+            stale = stale[:-1]
+        for i in reversed(stale):
+            self._unnumber(queue[i])
+            del queue[i]
+        if stale:
+            metrics.messages_coalesced.inc(amount=len(stale))
+
+    def _unnumber(self, entry):
+        """Takes a queued message that will never be written out of the replay buffer and the
+        numbering the client counts messages by, so a resuming client isn't sent it. Every
+        message after it is still queued, so the client has seen none of the ones renumbered."""
+
+        self._sent_count -= 1
+        for i in range(len(self._sent) - 1, -1, -1):
+            if self._sent[i] is entry:
+                del self._sent[i]
+                return
+
+    def _disconnect_slow_client(self):
+        """Closes the connection to a client that isn't reading its messages fast enough"""
+
+        metrics.slow_client_disconnects.inc()
+        if self._writer is not None:
+            self._writer.cancel()
+        self._set_disconnected()
+        asyncio.create_task(self._websocket.close(1008, 'too many unread messages'))
+
+    def _connection_lost(self, websocket):
+        """Suspends the client for resume_time seconds when websocket, its connection, is lost,
+        or disconnects it if it can't resume. Does nothing if the client has moved on to a new
+        connection since."""
+
+        if websocket is not self._websocket or self.suspended or self.disconnected:
+            return
+        if not self.resume_time:
+            self._set_disconnected()
+            return
+        self._send_queue.clear()
+        self._resume_timer = asyncio.get_running_loop().call_later(
+            self.resume_time, self._set_disconnected)
+
+    def resume(self, websocket, received):
+        """Moves the client onto a new connection, websocket, replaying the messages sent after
+        the first received messages, which the client has already seen. The new connection is
+        sent a 'resumed' message first, giving the number of the first message replayed.
+        Returns True if every missed message was replayed, False if some were too old to keep or
+        to fit in half of the send queue, or None if the client can't resume: when resume_time is 0, when it has disconnected,
+        or when the new connection uses a different wire format."""
+
+        if not self.resume_time or self.disconnected:
+            return None
+        if getattr(websocket, 'subprotocol', None) == codec.SUBPROTOCOL:
+            wire_format = 'binary'
+        else:
+            wire_format = 'json'
+        if wire_format != self.wire_format:
+            return None
+        if self._resume_timer is not None:
+            self._resume_timer.cancel()
+            self._resume_timer = None
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        old_websocket = self._websocket
+        self._websocket = websocket
+        first_kept = self._sent_count - len(self._sent)
+        start = min(
+            max(received, first_kept, self._sent_count - self.send_queue_size // 2),
+            self._sent_count
+        )
+        self._send_queue.clear()
+        self._send_queue.append(('resumed', self.encode_msg({'next': start}, 'resumed')))
+        self._send_queue.extend(list(self._sent)[start - first_kept:])
+        self._writer = asyncio.create_task(self._write_queued())
+        asyncio.create_task(old_websocket.close())
+        metrics.sessions_resumed.inc()
+        return start <= received
+
+    def _set_disconnected(self):
+        """Marks the client as gone, dropping its unsent messages and waking everything waiting on it"""
+
+        self.disconnected = True
+        if self._resume_timer is not None:
+            self._resume_timer.cancel()
+            self._resume_timer = None
+        self._send_queue.clear()
+        self._sent.clear()
+        self._fail_waiters(ClientDisconnectError())
+
+    def move_msgs_to(self, client):
+        """Routes every message received but not yet read to client instead, oldest first"""
+
+        while msg := self.get_msg():
+            client._route_msg(msg)
 
     def get_msg(self):
-        """Checks message queue and returns the oldest message in its entirety, else returns False."""
+        """Returns the oldest queued message of any type in its entirety, else returns False."""
         
-        try:
-            msg = self.msg_queue.popleft()
-            return msg
-        except IndexError:
+        oldest = None
+        for queue in self._msgs_by_type.values():
+            if queue and (oldest is None or queue[0][0] < oldest[0][0]):
+                oldest = queue
+        if oldest is None:
             return False
+        return oldest.popleft()[1]
 
     def get_msg_by_type(self, msg_type):
-        """Checks message queue and discards messages until finding one matching the msg_type, then returns.
+        """Returns the oldest queued message matching msg_type, leaving messages of other types in place.
         If no message is found returns False"""
         
-        try:
-            msg = None
-            while not msg:
-                msg = self.msg_queue.popleft()
-                if msg['type'] != msg_type:
-                    msg = None
-            return msg
-        except IndexError:
+        queue = self._msgs_by_type.get(msg_type)
+        if not queue:
             return False
+        return queue.popleft()[1]
 
     async def wait_for_msg(self, msg_type):
-        """Listens to queue until a message of type msg_type arrives, then returns payload"""
+        """Waits until a message of type msg_type arrives, then returns payload"""
         
-        while True:
-            msg = self.get_msg_by_type(msg_type)
-            if msg:
-                return msg['payload']
+        msg = self.get_msg_by_type(msg_type)
+        if msg:
+            return msg['payload']
+        if self.disconnected:
+            raise ClientDisconnectError
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[msg_type].append(waiter)
+        try:
+            with self.tracer.async_span(f'wait for {msg_type}', self.trace_row):
+                msg = await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # a message was handed over just before cancellation, so keep it
+                self._route_msg(waiter.result())
             else:
-                await asyncio.sleep(0.1)
+                try:
+                    self._waiters[msg_type].remove(waiter)
+                except ValueError:
+                    pass
+            raise
+        return msg['payload']
 
 class ClientDisconnectError(Exception):
     """Error class for client disconnecting early from websocket"""
-    pass
\ No newline at end of file
+    pass
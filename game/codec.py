@@ -0,0 +1,263 @@
+"""Binary wire format, for clients that ask for it when connecting.
+
+A client that opens its websocket with the SUBPROTOCOL subprotocol is sent binary frames made
+by encode, and may send binary frames that the server reads with decode. Text frames are read
+as JSON either way, and clients that don't ask (like the browser client) only ever get JSON.
+
+A frame is a one-byte opcode naming the message type, followed by the payload. The payloads
+sent most often have fixed layouts: bids, auctioneer bids and state acks are a 4-byte
+integer, a card is its card id, and a payment is the seven denomination counts. Every other
+payload, or one that doesn't fit its fixed layout, uses a compact tagged encoding in which
+common keys and names are single bytes, cards are their card ids, wallets are seven counts and
+hands are ten counts. decode(encode(msg_type, payload)) gives the same message as a JSON
+round trip would, except that a payment leaves out the denominations it has none of.
+"""
+
+import struct
+from .deck import CARDS, card, card_ids
+from .payment import DENOMINATIONS
+
+SUBPROTOCOL = 'kuhhandel.binary'
+
+# message types, indexed by opcode; 0 is any other type, sent by name
+TYPES = (
+    None, 'message', 'query', 'state', 'card', 'bid', 'auction-complete', 'game-over', 'error',
+    'player-id', 'username', 'response', 'auctioneer-bid', 'challenge', 'payment', 'state-ack',
+    'resync', 'resumed'
+)
+OPCODES = {msg_type: opcode for opcode, msg_type in enumerate(TYPES) if msg_type}
+
+# strings sent as one byte, indexed by code
+STRINGS = (
+    'message', 'my name', 'my wallet', 'global_state', 'players', 'deck_count', 'wallet', 'cards',
+    'completed_sets', 'version', 'full', 'base', 'bid', 'player', 'bidwinner', 'amount', 'name',
+    'value', 'suggestion', 'payment', 'player_id', 'username', 'card', 'auction', 'challenge'
+) + DENOMINATIONS + tuple(c.name for c in CARDS)
+STRING_CODES = {string: code for code, string in enumerate(STRINGS)}
+
+# tags of the tagged encoding
+NONE, FALSE, TRUE, INT, FLOAT, STR, LIST, DICT, NAME, CARD, WALLET, HAND = range(12)
+
+_uint = struct.Struct('>I')
+_float = struct.Struct('>d')
+_counts = struct.Struct('>7B')
+_hand = struct.Struct('>10B')
+_wallet_keys = list(DENOMINATIONS)
+_wallet_key_set = set(DENOMINATIONS)
+
+
+class CodecError(ValueError):
+    """Raised by decode for a frame that isn't a valid encoding of any message"""
+
+
+def encode(msg_type, payload):
+    """Returns the binary frame for a message of msg_type"""
+
+    opcode = OPCODES.get(msg_type, 0)
+    fixed = _checked_fixed(opcode, payload)
+    if fixed is not None:
+        return bytes((opcode,)) + fixed
+    out = bytearray((opcode,))
+    if not opcode:
+        _encode_value(msg_type, out)
+    # marks the payload as tagged, since no fixed layout starts with this byte
+    out.append(0xff)
+    _encode_value(payload, out)
+    return bytes(out)
+
+def decode(data):
+    """Returns the message {'type': ..., 'payload': ...} in a binary frame. Raises CodecError
+    if the frame is malformed."""
+
+    if not data:
+        raise CodecError('empty frame')
+    opcode = data[0]
+    if opcode >= len(TYPES):
+        raise CodecError(f'unknown opcode {opcode}')
+    try:
+        return _decode_frame(data, opcode)
+    except (IndexError, KeyError, TypeError, ValueError, RecursionError, struct.error) as e:
+        raise CodecError(f'malformed {TYPES[opcode] or "named"} frame: {e}') from e
+
+def _decode_frame(data, opcode):
+    if opcode and data[1:2] != b'\xff':
+        return {'type': TYPES[opcode], 'payload': _decode_fixed(opcode, data)}
+    pos = 1
+    if opcode:
+        msg_type = TYPES[opcode]
+    else:
+        msg_type, pos = _decode_value(data, pos)
+    payload, _ = _decode_value(data, pos + 1)
+    return {'type': msg_type, 'payload': payload}
+
+def _encode_fixed(opcode, payload):
+    """Returns the fixed layout of payload for opcode, or None if it has none or doesn't fit"""
+
+    if type(payload) is not dict:
+        return None
+    try:
+        if opcode == 5 and payload.keys() == {'amount'}:
+            return _uint.pack(payload['amount'])
+        if opcode in (12, 15) and len(payload) == 1:
+            return _uint.pack(payload['amount' if opcode == 12 else 'version'])
+        if opcode == 4 and payload.keys() == {'name', 'value'}:
+            card_id = card_ids[payload['name']]
+            if CARDS[card_id].value == payload['value']:
+                return bytes((card_id,))
+        if opcode == 14 and payload.keys() <= _wallet_key_set:
+            return _counts.pack(*(payload.get(name, 0) for name in DENOMINATIONS))
+    except (KeyError, TypeError, struct.error):
+        pass
+    return None
+
+def _checked_fixed(opcode, payload):
+    """Returns _encode_fixed, unless its first byte would be read as the tagged marker"""
+
+    fixed = _encode_fixed(opcode, payload)
+    if fixed is None or fixed[:1] == b'\xff':
+        return None
+    return fixed
+
+def _decode_fixed(opcode, data):
+    if opcode == 5:
+        return {'amount': _uint.unpack_from(data, 1)[0]}
+    if opcode == 12:
+        return {'amount': _uint.unpack_from(data, 1)[0]}
+    if opcode == 15:
+        return {'version': _uint.unpack_from(data, 1)[0]}
+    if opcode == 4:
+        c = CARDS[data[1]]
+        return {'name': c.name, 'value': c.value}
+    if opcode == 14:
+        return {name: n for name, n in zip(DENOMINATIONS, _counts.unpack_from(data, 1)) if n}
+    raise ValueError(f'no fixed layout for opcode {opcode}')
+
+def _encode_varint(n, out):
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _encode_value(value, out):
+    value_type = type(value)
+    if value_type is str:
+        code = STRING_CODES.get(value)
+        if code is not None:
+            out += bytes((NAME, code))
+        else:
+            data = value.encode()
+            out.append(STR)
+            _encode_varint(len(data), out)
+            out += data
+    elif value_type is int:
+        out.append(INT)
+        _encode_varint(value << 1 if value >= 0 else (-value << 1) - 1, out)
+    elif value_type is dict:
+        if len(value) == 7 and list(value) == _wallet_keys and _fits_counts(value.values()):
+            out.append(WALLET)
+            out += _counts.pack(*value.values())
+            return
+        out.append(DICT)
+        _encode_varint(len(value), out)
+        for key, item in value.items():
+            _encode_value(key if type(key) is str else str(key), out)
+            _encode_value(item, out)
+    elif value_type is card:
+        out += bytes((CARD, card_ids[value.name]))
+    elif value_type is list or value_type is tuple:
+        counts = _hand_counts(value)
+        if counts is not None:
+            out.append(HAND)
+            out += _hand.pack(*counts)
+            return
+        out.append(LIST)
+        _encode_varint(len(value), out)
+        for item in value:
+            _encode_value(item, out)
+    elif value is None:
+        out.append(NONE)
+    elif value is True:
+        out.append(TRUE)
+    elif value is False:
+        out.append(FALSE)
+    elif value_type is float:
+        out.append(FLOAT)
+        out += _float.pack(value)
+    else:
+        raise TypeError(f'cannot encode {value_type.__name__}')
+
+def _fits_counts(values):
+    return all(type(n) is int and 0 <= n < 256 for n in values)
+
+def _hand_counts(cards):
+    """Returns the count of each card id in a list of cards grouped in card id order,
+    as Player.cards is, or None if cards is empty or isn't such a list"""
+
+    if not cards or type(cards[0]) is not card:
+        return None
+    counts = [0] * len(CARDS)
+    last_id = 0
+    for c in cards:
+        if type(c) is not card:
+            return None
+        card_id = card_ids[c.name]
+        if card_id < last_id or CARDS[card_id] != c:
+            return None
+        counts[card_id] += 1
+        last_id = card_id
+    return counts if max(counts) < 256 else None
+
+def _decode_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+def _decode_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == NAME:
+        return STRINGS[data[pos]], pos + 1
+    if tag == INT:
+        n, pos = _decode_varint(data, pos)
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos
+    if tag == DICT:
+        length, pos = _decode_varint(data, pos)
+        value = {}
+        for _ in range(length):
+            key, pos = _decode_value(data, pos)
+            value[key], pos = _decode_value(data, pos)
+        return value, pos
+    if tag == LIST:
+        length, pos = _decode_varint(data, pos)
+        value = []
+        for _ in range(length):
+            item, pos = _decode_value(data, pos)
+            value.append(item)
+        return value, pos
+    if tag == STR:
+        length, pos = _decode_varint(data, pos)
+        if pos + length > len(data):
+            raise ValueError('string runs past the end of the frame')
+        return data[pos:pos + length].decode(), pos + length
+    if tag == CARD:
+        c = CARDS[data[pos]]
+        return [c.name, c.value], pos + 1
+    if tag == WALLET:
+        return dict(zip(DENOMINATIONS, _counts.unpack_from(data, pos))), pos + _counts.size
+    if tag == HAND:
+        counts = _hand.unpack_from(data, pos)
+        return [[c.name, c.value] for c, n in zip(CARDS, counts) for _ in range(n)], pos + _hand.size
+    if tag == NONE:
+        return None, pos
+    if tag == TRUE:
+        return True, pos
+    if tag == FALSE:
+        return False, pos
+    if tag == FLOAT:
+        return _float.unpack_from(data, pos)[0], pos + _float.size
+    raise ValueError(f'unknown tag {tag}')
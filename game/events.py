@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# one thread does every event log and snapshot write in the process, so each file's writes land in order
+_writer = None
+
+def submit(func, *args):
+    """Runs func(*args) on the background writer thread and returns its concurrent.futures.Future"""
+
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+    return _writer.submit(func, *args)
+
+
+class EventLog:
+    """Append-only record of every state-changing action in one game, one JSON array per line.
+    Players are referred to by seat, their index in the order they joined. Events are:
+        ['game', seed, num_players, auction_timeout]
+        ['join', seat, uuid, name]
+        ['turn', seat]
+        ['flip', card_name]
+        ['bid', seat, amount]
+        ['auction', winner_seat, payee_seat, bid, bought]
+        ['pay', payer_seat, payee_seat, [zeros, tens, ..., fivehundreds]]
+        ['card', seat, card_name]
+        ['challenge', challenger_seat, target_seat, card_name, num_cards, winner_seat]
+        ['end', reason]
+    Lines are buffered in memory and written on flush by a background thread,
+    so the event loop never waits on the disk. See game.replay for reading logs back."""
+
+    enabled = True
+
+    def __init__(self, path):
+        self.path = path
+        self._buffer = []
+        self._pending = None
+
+    def append(self, *event):
+        """Records an event, to be written on the next flush"""
+
+        self._buffer.append(json.dumps(event, separators=(',', ':')))
+
+    def flush(self):
+        """Hands the buffered events to the writer thread without waiting for the write"""
+
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        self._pending = submit(self._write, '\n'.join(lines) + '\n')
+
+    def discard(self):
+        """Drops the events buffered since the last flush"""
+
+        self._buffer = []
+
+    async def close(self):
+        """Flushes the remaining events and waits until they are all on disk"""
+
+        self.flush()
+        if self._pending is not None:
+            await asyncio.wrap_future(self._pending)
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(data)
+
+
+class NullEventLog:
+    """Event log for games that aren't recorded"""
+
+    enabled = False
+
+    def append(self, *event):
+        pass
+
+    def flush(self):
+        pass
+
+    def discard(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+NULL_EVENT_LOG = NullEventLog()
+
+def read(path):
+    """Returns the list of events in the log file at path"""
+
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -1,8 +1,13 @@
 import asyncio
 from collections import deque
-import datetime
 import random
-from .deck import make_deck
+import secrets
+from .deck import CARDS, card_ids, make_deck
+from game import metrics, tracing
+from game.events import NULL_EVENT_LOG, EventLog
+from game.player import Player
+from game.snapshot import NULL_SNAPSHOTTER
+from game.wallet import Wallet
 from game.client import ClientDisconnectError
 
 
@@ -10,21 +15,105 @@ class Game:
     """Primary class for implementing Kuh Handel gameplay.
     param num_players: Game can't start until this many players join
     param auction_timeout: time (in seconds) players have before auction closes after each bid 
+    param tracer: records the time spent in each phase of the game, see game.tracing
+    param seed: seed for shuffling the deck; a game replays exactly given the same seed and moves.
+    A random seed is chosen when none is given, and kept as game.seed
+    param event_log: records every state-changing action, see game.events
+    param snapshotter: saves the game's state at each turn boundary, see game.snapshot
+    param stand_in: called with a player whose client has disconnected, returns a client to play
+    on in their place, or None to end the game; without one every disconnect ends the game
     """
     
     # constructor
 
-    def __init__(self, num_players=3, auction_timeout=15):
+    def __init__(self, num_players=3, auction_timeout=15, tracer=None, seed=None, event_log=None,
+            snapshotter=None, stand_in=None):
         self.players = deque()
+        self.seed = secrets.randbits(64) if seed is None else seed
+        # shuffled once, then dealt from the end
         self.deck = make_deck()
+        random.Random(self.seed).shuffle(self.deck)
         self.num_players = num_players
         self.auction_timeout = auction_timeout
         self.global_state = None
-        self.is_ready = False
-        self.is_complete = False
+        self.state_version = 0
+        # lifecycle signals, awaitable with e.g. await game.completed.wait()
+        self.ready = asyncio.Event()
+        self.started = asyncio.Event()
+        self.completed = asyncio.Event()
+        self.tracer = tracer or tracing.NULL_TRACER
+        self.events = event_log or NULL_EVENT_LOG
+        self.events.append('game', self.seed, num_players, auction_timeout)
+        self.snapshots = snapshotter or NULL_SNAPSHOTTER
+        self.stand_in = stand_in
+
+    @classmethod
+    def from_snapshot(cls, state):
+        """Returns a Game rebuilt from to_snapshot, as of the start of a turn. Its players have
+        no connection until their clients rejoin with Player.replace_client, or for bots until the
+        caller gives them a new agent, and the game isn't ready until the caller sets game.ready."""
+
+        game = cls(num_players=state['num_players'], auction_timeout=state['auction_timeout'],
+            seed=state['seed'])
+        if state['log']:
+            game.events = EventLog(state['log'])
+        del game.deck[state['deck_count']:]
+        game.state_version = state['state_version']
+        donkeys_played = 4 - sum(c.name == 'donkey' for c in game.deck)
+        seats = {}
+        for seat, data in state['players'].items():
+            player = Player(None, data['uuid'])
+            player.name = data['name']
+            player.is_bot = data.get('bot', False)
+            player.seat = int(seat)
+            player.wallet = Wallet(data['wallet'], donkeys_played)
+            for card, held in zip(CARDS, data['hand']):
+                for _ in range(held):
+                    player.add_card(card)
+            player.completed_sets = [CARDS[card_ids[name]] for name in data['completed_sets']]
+            seats[player.seat] = player
+        game.players = deque(seats[seat] for seat in state['order'])
+        return game
 
     # accessors
 
+    @property
+    def is_ready(self):
+        """returns true once enough players have joined to start the game"""
+
+        return self.ready.is_set()
+
+    @property
+    def is_complete(self):
+        """returns true once the game has finished or been ended"""
+
+        return self.completed.is_set()
+
+    def to_snapshot(self):
+        """Returns what is needed to restore the game at a turn boundary, as plain JSON data.
+        The deck is stored as its count, since it is dealt in order from the game's seed."""
+
+        return {
+            'seed': self.seed,
+            'num_players': self.num_players,
+            'auction_timeout': self.auction_timeout,
+            'log': self.events.path if self.events.enabled else None,
+            'deck_count': len(self.deck),
+            'state_version': self.state_version,
+            'order': [p.seat for p in self.players],
+            'players': {
+                str(p.seat): {
+                    'uuid': str(p.uuid),
+                    'name': p.name,
+                    'bot': p.is_bot,
+                    'hand': list(p.hand),
+                    'completed_sets': [c.name for c in p.completed_sets],
+                    'wallet': list(p.wallet.cards)
+                }
+                for p in self.players
+            }
+        }
+
     def players_can_trade(self):
         """returns true if any player has a trade available"""
 
@@ -35,9 +124,15 @@ class Game:
     def add_player(self, player):
         """Add a player object to this game"""
 
+        player.seat = len(self.players)
         self.players.append(player)
+        self.events.append('join', player.seat, str(player.uuid), player.name)
+        if self.tracer.enabled:
+            player.client.tracer = self.tracer
+            player.client.trace_row = len(self.players)
+            self.tracer.add_row(len(self.players), player.name)
         if len(self.players) == self.num_players:
-            self.is_ready = True
+            self.ready.set()
 
     def remove_player(self, ws):
         """Remove player object from this game by passing the websocket connection
@@ -53,22 +148,22 @@ class Game:
         self.players.remove(player)
 
     async def flip_card(self):
-        """returns a random card from the deck. If it is a donkey, updates each player's wallet accordingly and pushes global state"""
+        """returns the next card from the shuffled deck. If it is a donkey, updates each player's wallet accordingly and pushes global state"""
         
         if not len(self.deck):
             return False
-        card = self.deck.pop(random.randrange(0, len(self.deck)))
+        card = self.deck.pop()
+        self.events.append('flip', card.name)
         if card.name == 'donkey':
             for player in self.players:
                 player.wallet.donkey_played()
-            self.update_global_state()
-            for player in self.players:
-                await player.update_state(self.global_state)
+            await self.push_state()
         return card
 
     def update_global_state(self):
-        """update the global state property to latest state"""
+        """update the global state property to latest state and bump its version"""
         
+        self.state_version += 1
         self.global_state = {
             'players': [p.name for p in self.players],
             **{p.name: p.get_global_state() for p in self.players},
@@ -77,22 +172,74 @@ class Game:
 
     # IO - methods that provide a wrapper for the player object
 
-    async def push_all(self, msg):
-        """send a message to each player in game"""
+    async def push_all(self, msg, msg_type, ignore_disconnects=False):
+        """send a message of type msg_type to each player in game. The message is serialized once
+        per wire format and queued for every client, without waiting for any socket. Once it is
+        queued for everyone, raises ClientDisconnectError if any player has disconnected, unless
+        ignore_disconnects is True"""
         
-        #TODO: build this out and refactor all group calls to use it
-        raise Exception('Game.push_all is not implemented yet')
+        metrics.messages_sent.inc(msg_type, len(self.players))
+        # encode once per wire format: JSON, binary, or none for in-process clients
+        encoded = {}
+        disconnected = []
+        for p in self.players:
+            wire_format = p.client.wire_format
+            if wire_format not in encoded:
+                encoded[wire_format] = p.client.encode_msg(msg, msg_type)
+            try:
+                await p.client.send_encoded(encoded[wire_format], msg_type)
+            except ClientDisconnectError:
+                disconnected.append(p)
+        if ignore_disconnects:
+            return
+        for p in disconnected:
+            if not await self._stand_in_for(p):
+                raise ClientDisconnectError
+            await p.client.send_msg(msg, msg_type)
+
+    async def push_state(self):
+        """update the global state and send each player their view of it"""
+
+        self.update_global_state()
+        for p in self.players:
+            await self._ask(p, p.update_state, self.global_state, self.state_version)
 
     async def _push_bid(self, bid, player):
         """utility auction function to send latest bid to players.
             bid: int
             player: Player object"""
 
-        for p in self.players:
-            await p.client.send_msg({
-                    'bid': bid,
-                    'player': player.name
-                }, 'bid')
+        await self.push_all({
+            'bid': bid,
+            'player': player.name
+        }, 'bid')
+
+    async def _ask(self, player, query, *args):
+        """Awaits query(*args), a method of player. If player's client has disconnected, their
+        stand-in is asked instead, and without one ClientDisconnectError is raised."""
+
+        while True:
+            try:
+                return await query(*args)
+            except ClientDisconnectError:
+                if not await self._stand_in_for(player):
+                    raise
+
+    async def _stand_in_for(self, player):
+        """Hands a disconnected player's seat to a client from stand_in and sends it the game
+        state. Returns False if there is no stand-in. Does nothing if the seat's client is already
+        a connected one, e.g. when a waiter on the disconnected client fails after the seat was
+        handed over."""
+
+        if not player.client.disconnected:
+            return True
+        client = self.stand_in(player) if self.stand_in else None
+        if client is None:
+            return False
+        player.replace_client(client)
+        if self.global_state is not None:
+            await player.update_state(self.global_state, self.state_version)
+        return True
 
     # Gameplay - core methods for running the game
 
@@ -100,99 +247,160 @@ class Game:
         """Waits for enough players to join, then starts the game"""
         
         try:
-            while not self.is_ready:
-                await asyncio.sleep(1)
+            await self.ready.wait()
+            self.started.set()
             await self._play()
+            self.snapshots.remove()
         except ClientDisconnectError:
-            for p in self.players:
-                
-                try:
-                    await p.client.send_msg(
-                        'Sorry, the game has been ended because a player disconnected',
-                        'error'
-                    )
-                    
-                except ClientDisconnectError:
-                    continue
-            self.is_complete = True
+            self.snapshots.remove()
+            self.events.append('end', 'disconnect')
+            await self.push_all(
+                'Sorry, the game has been ended because a player disconnected',
+                'error',
+                ignore_disconnects=True
+            )
+        except asyncio.CancelledError:
+            # the snapshot is from the start of the turn, so a restored game plays the
+            # turn again and logs its events then
+            if self.started.is_set():
+                self.events.discard()
+            raise
+        finally:
+            self.completed.set()
+            await self.events.close()
+            if self.tracer.enabled:
+                await asyncio.get_running_loop().run_in_executor(None, self.tracer.write)
 
     async def _play(self):
         """function implementing main gameplay"""
         
+        loop = asyncio.get_running_loop()
         while len(self.deck) or self.players_can_trade():
+            turn_start = loop.time()
+            self.events.flush()
+            self.snapshots.snapshot(self)
+            self.events.append('turn', self.players[0].seat)
 
-            # synchronize game state
-            self.update_global_state()
-            for p in self.players:
-                await p.update_state(self.global_state)
-
-            player = self.players[0]
-            
-            # player decides to auction card or challenge
-            challenge_list = self.has_legal_challenge(player)
-            action = await player.choose_action(can_challenge=len(challenge_list), can_auction=len(self.deck))
-            
-            if action == 'auction':
-                card = await self.flip_card()
-                for p in self.players:
-                    await p.send_card(card)
-                auction_results, bidwinner, payee = await self.auction()
-                
-                # push results to players
-                for p in self.players:
-                    await p.client.send_msg(auction_results, 'auction-complete')
-                
-                # clean up after auction
-                if not auction_results['bid'] > 0:
-                    # no one bid, auctioneer keeps card for free
-                    player.add_card(card)
-                else:
-                    payment = await bidwinner.create_payment(auction_results['bid'])
-                    payee.accept_payment(payment)
-                    bidwinner.add_card(card)
-                    
-            elif action == 'challenge':
-                await self.challenge(player, challenge_list)
-
-            elif action == 'pass':
-                pass
-
-            else:
-                raise Exception(f'unknown action {action} passed to game')
+            with self.tracer.span('turn', player=self.players[0].name):
+                await self._play_turn()
 
             self.players.rotate()
+            metrics.turn_seconds.observe(loop.time() - turn_start)
 
         # find the winner
         score = {p.get_score(): p.name for p in self.players}
         score_list = list(score.keys())
         score_list.sort(reverse=True)
         ordered_score = {score[s]: s for s in score_list}
-        for p in self.players:
-            await p.client.send_msg(ordered_score, 'game-over')
+        self.events.append('end', 'complete')
+        await self.push_all(ordered_score, 'game-over')
         
         # allow client socket to close
-        self.is_complete = True
+        self.completed.set()
+
+    async def _play_turn(self):
+        """plays the turn of the player at the front of the queue"""
+
+        # synchronize game state
+        with self.tracer.span('push state'):
+            await self.push_state()
+
+        player = self.players[0]
+        
+        # player decides to auction card or challenge
+        challenge_list = self.has_legal_challenge(player)
+        with self.tracer.span('choose action'):
+            action = await self._ask(player, player.choose_action, len(challenge_list), len(self.deck))
+        
+        if action == 'auction':
+            with self.tracer.span('flip card'):
+                card = await self.flip_card()
+                await self.push_all({'name': card.name, 'value': card.value}, 'card')
+            with self.tracer.span('auction', card=card.name):
+                auction_results, bidwinner, payee = await self.auction()
+            
+            # push results to players
+            with self.tracer.span('push auction results'):
+                await self.push_all(auction_results, 'auction-complete')
+            
+            # clean up after auction
+            if not auction_results['bid'] > 0:
+                # no one bid, auctioneer keeps card for free
+                player.add_card(card)
+                self.events.append('card', player.seat, card.name)
+            else:
+                with self.tracer.span('create payment', bid=auction_results['bid']):
+                    payment = await self._ask(bidwinner, bidwinner.create_payment, auction_results['bid'])
+                payee.accept_payment(payment)
+                bidwinner.add_card(card)
+                self.events.append('pay', bidwinner.seat, payee.seat, payment.cards)
+                self.events.append('card', bidwinner.seat, card.name)
+                
+        elif action == 'challenge':
+            with self.tracer.span('challenge'):
+                await self.challenge(player, challenge_list)
+
+        elif action == 'pass':
+            pass
+
+        else:
+            raise Exception(f'unknown action {action} passed to game')
 
     async def auction(self):
         """runs an auction between players[1:], defaulting to players[0] at cost of 0. Auction is open for param timeout seconds after the last successful bid, after which it returns the bidwinner and winning bid amount"""
         
-        auction_end = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.auction_timeout)
+        loop = asyncio.get_running_loop()
         bid = 0
         # auctioneer wins the bid, unless someone else bids
         auctioneer = bidholder = self.players[0]
+        # bids sent for an earlier card mustn't count towards this one
+        for p in self.players:
+            p.discard_bids()
         await self._push_bid(bid, auctioneer)
-        # can't slice a deque, so create a list here
-        bidding_players = [p for p in self.players if p != auctioneer]
-        
-        while datetime.datetime.utcnow() < auction_end:
-            for player in bidding_players:
-                msg = player.get_bid()
-                if msg and int(msg['amount']) > bid:
-                    bidholder = player
-                    auction_end = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.auction_timeout)
-                    bid = msg['amount']
-                    await self._push_bid(bid, player)
-            await asyncio.sleep(0.1)
+        # each bidder has one task waiting on their next bid, so the auction
+        # only wakes when a bid arrives or the deadline passes
+        bid_waiters = {
+            asyncio.create_task(p.wait_for_bid()): p
+            for p in self.players if p != auctioneer
+        }
+        auction_start = loop.time()
+        auction_end = auction_start + self.auction_timeout
+
+        try:
+            while bid_waiters:
+                time_left = auction_end - loop.time()
+                if time_left > 0:
+                    done, _ = await asyncio.wait(
+                        bid_waiters, timeout=time_left, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    # deadline has passed: yield once so bids that have already arrived
+                    # can be read, and close the auction if there are none
+                    await asyncio.sleep(0)
+                    done = [waiter for waiter in bid_waiters if waiter.done()]
+                    if not done:
+                        break
+                for waiter in done:
+                    player = bid_waiters.pop(waiter)
+                    try:
+                        msg = waiter.result()
+                    except ClientDisconnectError:
+                        if not await self._stand_in_for(player):
+                            raise
+                        msg = None
+                    bid_waiters[asyncio.create_task(player.wait_for_bid())] = player
+                    if msg is None:
+                        continue
+                    if int(msg['amount']) > bid:
+                        bidholder = player
+                        auction_end = loop.time() + self.auction_timeout
+                        bid = msg['amount']
+                        self.events.append('bid', player.seat, bid)
+                        await self._push_bid(bid, player)
+        finally:
+            for waiter in bid_waiters:
+                waiter.cancel()
+            await asyncio.gather(*bid_waiters, return_exceptions=True)
+            metrics.auction_seconds.observe(loop.time() - auction_start)
 
         # check if auctioneer wishes to buy card at bidwinning price
         if bid > 0:
@@ -204,7 +412,10 @@ class Game:
             else:
                 payee = auctioneer
         else:
+            will_buy = False
             payee = None
+        self.events.append(
+            'auction', bidholder.seat, payee.seat if payee else None, bid, will_buy)
 
         return {
             'bidwinner': bidholder.name,
@@ -217,12 +428,10 @@ class Game:
         # get challenge from player to move
         payload = None
         while not payload:
-            payload = await player.get_challenge()
+            payload = await self._ask(player, player.get_challenge, challenge_list)
             player_to_challenge = [p for p in self.players if p.name == payload['player']][0]
             if player_to_challenge not in challenge_list:
-                await player.client.send_msg({
-                    'message': 'You can\'t challenge that person'
-                }, 'error')
+                await self._ask(player, player.send_error, 'You can\'t challenge that person')
                 payload = None
                 continue
             else:
@@ -230,9 +439,7 @@ class Game:
                 if num_cards_to_challenge := self.verify_challenge(player, player_to_challenge, card_name):
                     break
                 else:
-                    await player.client.send_msg({
-                        'message': 'Your challenge was not valid'
-                    }, 'error')
+                    await self._ask(player, player.send_error, 'Your challenge was not valid')
                     payload = None
         
         # put cards in question to the side
@@ -242,24 +449,22 @@ class Game:
             card_holder.append(player_to_challenge.get_card_by_name(card_name))
 
         # get payment from challenging player and update everyone on challenge
-        payment1 = await player.get_challenge_payment()
-        for p in self.players:
-            if num_cards_to_challenge == 2:
-                msg = {
+        payment1 = await self._ask(player, player.get_challenge_payment)
+        if num_cards_to_challenge == 2:
+            msg = {
                 'message': f'{player.name} has challenged {player_to_challenge.name} for all the {card_name}s with {payment1.count} money cards.'
             }
-            else:
-                msg = {
+        else:
+            msg = {
                 'message': f'{player.name} has challenged {player_to_challenge.name} for a {card_name} with {payment1.count} money cards.'
             }
-            await p.client.send_msg(msg, 'message')
+        await self.push_all(msg, 'message')
 
         # get payment from challenged player
-        payment2 = await player_to_challenge.get_challenge_payment()
-        for p in self.players:
-            await p.client.send_msg({
-                'message': f'{player_to_challenge.name} has responded to the challenge with {payment2.count} money cards.'
-            }, 'message')
+        payment2 = await self._ask(player_to_challenge, player_to_challenge.get_challenge_payment)
+        await self.push_all({
+            'message': f'{player_to_challenge.name} has responded to the challenge with {payment2.count} money cards.'
+        }, 'message')
 
         if payment1.total >= payment2.total:
             buyer = player
@@ -269,26 +474,22 @@ class Game:
         # exchange payments
         player.wallet.accept_payment(payment2)
         player_to_challenge.accept_payment(payment1)
+        self.events.append('pay', player.seat, player_to_challenge.seat, payment1.cards)
+        self.events.append('pay', player_to_challenge.seat, player.seat, payment2.cards)
         
-        for p in self.players:
-            await p.client.send_msg({
-                'message': f'{buyer.name} has won the challenge!'
-            }, 'message')
+        await self.push_all({
+            'message': f'{buyer.name} has won the challenge!'
+        }, 'message')
 
         for card in card_holder:
             buyer.add_card(card)
+        self.events.append(
+            'challenge', player.seat, player_to_challenge.seat, card_name, num_cards_to_challenge, buyer.seat)
     
     def has_legal_challenge(self, player):
         """returns a list of players that player can challenge"""
         
-        others = [p for p in self.players if p != player]
-        can_challenge = []
-        player_cards = set(player.cards)
-        for p in others:
-            other_cards = set(p.cards)
-            if player_cards.intersection(other_cards):
-                can_challenge.append(p)
-        return can_challenge
+        return [p for p in self.players if p != player and p.hand_mask & player.hand_mask]
 
     def verify_challenge(self, player, target_player, card_name):
         """Confirms that player can make challenge to player and card in msg dict.
@@ -297,15 +498,15 @@ class Game:
         # check challenge validity
         if not target_player:
             return False
-        player_hand = [c.name for c in player.cards]
-        if not card_name in player_hand:
+        player_count = player.count_cards(card_name)
+        if not player_count:
             return False
-        target_player_hand = [c.name for c in target_player.cards]
-        if not card_name in target_player_hand:
+        target_player_count = target_player.count_cards(card_name)
+        if not target_player_count:
             return False
 
         #challenge is valid, find how many cards can be challenged
-        if player_hand.count(card_name) == 2 and target_player_hand.count(card_name) == 2:
+        if player_count == 2 and target_player_count == 2:
             return 2
         return 1
 
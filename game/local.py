@@ -0,0 +1,164 @@
+import asyncio
+import multiprocessing
+import random
+from uuid import uuid4
+from . import metrics
+from .client import Client
+from .game import Game
+from .payment import DENOMINATIONS, VALUES
+from .player import Player
+
+# money card denominations, as named in Wallet and Payment
+denominations = tuple(zip(DENOMINATIONS, VALUES))
+
+
+class LocalClient(Client):
+    """In-process stand-in for Client, for running games without websockets.
+    Messages are handed to agent as Python objects, with no JSON encoding and no sockets.
+    param agent: callable taking (msg_type, payload) and returning either None or a
+    (msg_type, payload) tuple, which is received as if the remote client had sent it
+    """
+
+    def __init__(self, agent):
+        super().__init__(None)
+        self.wire_format = 'local'
+        self.agent = agent
+
+    async def handle_msgs(self, is_complete):
+        """Nothing to receive: agent responses are routed as soon as they are made"""
+
+    def encode_msg(self, msg, msg_type):
+        """Returns the message unencoded, since it never leaves the process"""
+
+        return msg_type, msg
+
+    async def send_encoded(self, data, msg_type=None):
+        """Passes a message to the agent and routes its response, if any"""
+
+        response = self.agent(*data)
+        if response:
+            msg_type, payload = response
+            self._route_msg({'type': msg_type, 'payload': payload})
+
+    async def _send_msg(self, msg):
+        """Accepts a dictionary and passes it to the agent"""
+
+        metrics.messages_sent.inc(msg['type'])
+        await self.send_encoded((msg['type'], msg['payload']))
+
+
+class SimpleAgent:
+    """Basic agent for in-process games. Always auctions when it has the choice, raises bids by
+    about a tenth of the animal's value up to its full value, challenges an opponent for an
+    animal they share and pays with its smallest money cards."""
+
+    def __init__(self, name, rng=None):
+        self.name = name
+        self.rng = rng or random.Random()
+        self.state = None
+        self.card = None
+        self.auctioneer = None
+
+    def __call__(self, msg_type, payload):
+        if msg_type == 'state':
+            self.state = payload
+        elif msg_type == 'card':
+            self.card = payload
+        elif msg_type == 'bid':
+            return self.on_bid(payload)
+        elif msg_type == 'query':
+            return self.on_query(payload)
+        return None
+
+    def on_bid(self, payload):
+        """Raises the bid if the animal is still worth more and the agent can afford it"""
+
+        if payload['bid'] == 0:
+            self.auctioneer = payload['player']
+        if self.name in (self.auctioneer, payload['player']) or not self.card:
+            return None
+        bid = payload['bid'] + max(10, self.card['value'] // 100 * 10)
+        if bid > self.card['value'] or bid > self.wallet_total():
+            return None
+        return 'bid', {'amount': bid}
+
+    def on_query(self, payload):
+        """Answers the queries made by Player"""
+
+        if payload == 'Please enter your username':
+            return 'username', {'username': self.name}
+        if payload == 'Please choose auction or challenge':
+            return 'response', 'auction'
+        message = payload['message'] if isinstance(payload, dict) else payload
+        if 'challenge' in message:
+            return 'challenge', self.choose_challenge()
+        if 'payment cards' in message:
+            if isinstance(payload, dict) and 'suggestion' in payload:
+                return 'payment', payload['suggestion']
+            return 'payment', self.choose_payment(int(message.rsplit(' ', 1)[1]))
+        return None
+
+    def wallet_total(self):
+        """Returns the total held in the agent's wallet as of the latest state"""
+
+        if not self.state:
+            return 0
+        wallet = self.state['my wallet']
+        return sum(wallet[name] * value for name, value in denominations)
+
+    def choose_challenge(self):
+        """Picks an opponent and an animal they both hold"""
+
+        global_state = self.state['global_state']
+        my_animals = {c[0] for c in global_state[self.name]['cards']}
+        options = [
+            (name, animal)
+            for name in global_state['players'] if name != self.name
+            for animal in my_animals.intersection(c[0] for c in global_state[name]['cards'])
+        ]
+        name, animal = self.rng.choice(options)
+        return {'player': name, 'card': animal}
+
+    def choose_payment(self, total):
+        """Returns money cards totalling at least total, spending the smallest cards first"""
+
+        wallet = self.state['my wallet']
+        payment = {}
+        paid = 0
+        for name, value in denominations[1:]:
+            while paid < total and wallet[name] > payment.get(name, 0):
+                payment[name] = payment.get(name, 0) + 1
+                paid += value
+        return payment
+
+
+async def play_local_game(agents, auction_timeout=0, seed=None):
+    """Plays a complete game between in-process agents and returns each player's score by name.
+    With the default auction_timeout of 0 an auction closes as soon as no agent raises the bid.
+    seed is passed on to Game to fix the order of the deck."""
+
+    game = Game(num_players=len(agents), auction_timeout=auction_timeout, seed=seed)
+    for agent in agents:
+        player = Player(None, str(uuid4()), client=LocalClient(agent))
+        await player.get_name()
+        game.add_player(player)
+    await game.run()
+    return {p.name: p.get_score() for p in game.players}
+
+def run_local_games(num_games, num_players=3, processes=1):
+    """Plays num_games games between SimpleAgents and returns their scores.
+    Games are split across processes worker processes, each running its share on one event loop."""
+
+    if processes > 1:
+        shares = [num_games // processes + (i < num_games % processes) for i in range(processes)]
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(run_local_games, [(share, num_players) for share in shares])
+        return [scores for share in results for scores in share]
+
+    async def play_all():
+        return [
+            await play_local_game([SimpleAgent(f'agent {i}') for i in range(num_players)])
+            for _ in range(num_games)
+        ]
+
+    return asyncio.run(play_all())
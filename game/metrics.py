@@ -0,0 +1,174 @@
+import asyncio
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+
+# every metric, in the order it is rendered
+registry = []
+
+# label values beyond this many are counted together as 'other', since some come from clients
+MAX_LABEL_VALUES = 100
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by the value of one label"""
+
+    def __init__(self, name, description, label=None):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = defaultdict(int)
+        registry.append(self)
+
+    def inc(self, label_value=None, amount=1):
+        values = self.values
+        if label_value not in values and len(values) >= MAX_LABEL_VALUES:
+            label_value = 'other'
+        values[label_value] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        if not self.values and self.label is None:
+            lines.append(f'{self.name} 0')
+        for label_value, value in self.values.items():
+            lines.append(f'{self.name}{_labels(self.label, label_value)} {value}')
+        return lines
+
+
+class Gauge:
+    """Value read when metrics are collected, by calling func, so it costs nothing until then"""
+
+    def __init__(self, name, description, func):
+        self.name = name
+        self.description = description
+        self.func = func
+        registry.append(self)
+
+    def render(self):
+        return [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} gauge',
+            f'{self.name} {self.func()}'
+        ]
+
+
+class Histogram:
+    """Counts observations into fixed buckets, and tracks their sum"""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        registry.append(self)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {total}')
+        total += self.counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {total}')
+        lines.append(f'{self.name}_sum {self.sum}')
+        lines.append(f'{self.name}_count {total}')
+        return lines
+
+
+def _labels(label, label_value):
+    """Formats a label set for the text format"""
+
+    if label is None:
+        return ''
+    escaped = str(label_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{{{label}="{escaped}"}}'
+
+def render():
+    """Returns every metric in the Prometheus text exposition format"""
+
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+async def serve(host='127.0.0.1', port=9877):
+    """Starts an HTTP server answering every request with the current metrics, and returns it"""
+
+    async def handle(reader, writer):
+        try:
+            # read and ignore the request, up to the blank line ending its headers
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            body = render().encode()
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/plain; version=0.0.4\r\n'
+                + f'Content-Length: {len(body)}\r\n'.encode()
+                + b'Connection: close\r\n\r\n'
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# clients currently alive, used to read queue depths when metrics are collected
+clients = weakref.WeakSet()
+
+seconds_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60)
+
+messages_received = Counter(
+    'kuhhandel_messages_received_total', 'Messages received from clients', 'type')
+malformed_messages = Counter(
+    'kuhhandel_malformed_messages_total', 'Frames received from clients that could not be decoded')
+messages_dropped = Counter(
+    'kuhhandel_messages_dropped_total', 'Messages received from clients of a type the game never reads')
+messages_sent = Counter(
+    'kuhhandel_messages_sent_total', 'Messages sent to clients', 'type')
+messages_coalesced = Counter(
+    'kuhhandel_messages_coalesced_total', 'Stale state messages dropped from full send queues')
+slow_client_disconnects = Counter(
+    'kuhhandel_slow_client_disconnects_total', 'Clients disconnected for letting their send queue fill')
+query_timeouts = Counter(
+    'kuhhandel_query_timeouts_total', 'Queries answered by default because their deadline passed', 'type')
+send_seconds = Histogram(
+    'kuhhandel_send_seconds', 'Time taken to write a message to a client socket', seconds_buckets)
+auction_seconds = Histogram(
+    'kuhhandel_auction_seconds', 'Duration of auctions', seconds_buckets)
+turn_seconds = Histogram(
+    'kuhhandel_turn_seconds', 'Duration of turns', seconds_buckets)
+games_created = Counter(
+    'kuhhandel_games_created_total', 'Games created')
+games_completed = Counter(
+    'kuhhandel_games_completed_total', 'Games completed or ended')
+bots_seated = Counter(
+    'kuhhandel_bots_seated_total', 'Bots seated in games that waited too long for players')
+stand_ins = Counter(
+    'kuhhandel_stand_ins_total', 'Bots that took over from a disconnected player')
+disconnects = Counter(
+    'kuhhandel_disconnects_total', 'Clients that disconnected with an error')
+sessions_resumed = Counter(
+    'kuhhandel_sessions_resumed_total', 'Clients that resumed their session on a new connection')
+Gauge('kuhhandel_clients', 'Clients belonging to players still in memory', lambda: len(clients))
+Gauge(
+    'kuhhandel_inbound_queue_depth_max',
+    'Most unread messages queued for any one client',
+    lambda: max((c.queue_depth for c in clients), default=0)
+)
+Gauge(
+    'kuhhandel_inbound_queue_depth_total',
+    'Unread messages queued across all clients',
+    lambda: sum(c.queue_depth for c in clients)
+)
+Gauge(
+    'kuhhandel_send_queue_depth_max',
+    'Most messages waiting to be written to any one client',
+    lambda: max((c.send_queue_depth for c in clients), default=0)
+)
@@ -31,6 +31,11 @@ class MockSocket:
         await asyncio.sleep(self.time_delay)
         self.msg_queue.append(msg)
 
+    async def close(self, code=1000, reason=''):
+        """mocks closing the connection"""
+
+        self.close_code = code
+
     async def recv(self):
         """mocks async network return by returning
         val saved during init"""
@@ -0,0 +1,149 @@
+from .deck import make_deck
+from .wallet import Wallet
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for economy simulations, not to run the game server
+    np = None
+
+
+def simulate(num_games, num_players=3, price_factor=0.5, seed=None, batch_size=100_000):
+    """Simulates num_games games at once and returns summary statistics of the game economy.
+    Each game shuffles the make_deck deck and flips every card in turn. Donkeys pay into every
+    wallet as Wallet.donkey_played does, and each card is bought by a random opponent of the
+    auctioneer for price_factor of its value (rounded down to 10, capped at what they hold).
+    Money is tracked as wallet totals. At the end each animal's cards go to whoever holds the
+    most of them, standing in for challenges, and scores are counted as Player.get_score does.
+    param seed: seed for numpy's random generator, so runs can be repeated
+    param batch_size: number of games simulated together, bounding memory use. Each batch is
+    reduced to counts of the values seen before the next one is simulated.
+    """
+
+    if np is None:
+        raise ImportError('monte_carlo.simulate requires numpy: pip install numpy')
+
+    rng = np.random.default_rng(seed)
+    donkey_draws = [_Tally() for _ in range(4)]
+    money_supply = 0
+    prices, scores, winning_scores, winning_margins = _Tally(), _Tally(), _Tally(), _Tally()
+    for start in range(0, num_games, batch_size):
+        batch_draws, batch_supply, batch_prices, batch_scores = _simulate_batch(
+            min(batch_size, num_games - start), num_players, price_factor, rng)
+        for i, tally in enumerate(donkey_draws):
+            tally.add(batch_draws[:, i])
+        money_supply = money_supply + batch_supply
+        prices.add(batch_prices)
+        scores.add(batch_scores)
+        top_two = np.sort(batch_scores, axis=1)[:, -2:]
+        winning_scores.add(top_two[:, 1])
+        winning_margins.add(top_two[:, 1] - top_two[:, 0])
+
+    return {
+        'games': num_games,
+        'donkey_draw': [tally.summarize() for tally in donkey_draws],
+        'money_supply': (money_supply / num_games).tolist(),
+        'auction_price': prices.summarize(),
+        'score': scores.summarize(),
+        'winning_score': winning_scores.summarize(),
+        'winning_margin': winning_margins.summarize(),
+    }
+
+def _simulate_batch(num_games, num_players, price_factor, rng):
+    """Simulates one batch of games. Returns the draw index of each donkey per game, the summed
+    per-player money supply after each draw, every auction price and each player's final score."""
+
+    deck = make_deck()
+    animal_names = sorted({c.name for c in deck}, key=[c.name for c in deck].index)
+    card_animals = np.array([animal_names.index(c.name) for c in deck], dtype=np.int8)
+    card_values = np.array([c.value for c in deck], dtype=np.int32)
+    animal_values = card_values[[card_animals.tolist().index(i) for i in range(len(animal_names))]]
+    donkey = animal_names.index('donkey')
+
+    # money added to each wallet by the first, second, ... donkey
+    wallet = Wallet()
+    start_total = wallet.total
+    donkey_bonus = []
+    for _ in range(4):
+        before = wallet.total
+        wallet.donkey_played()
+        donkey_bonus.append(wallet.total - before)
+    donkey_bonus = np.array(donkey_bonus + [0], dtype=np.int32)
+
+    games = np.arange(num_games)
+    order = rng.permuted(np.tile(np.arange(len(deck), dtype=np.int8), (num_games, 1)), axis=1)
+    wallets = np.full((num_games, num_players), start_total, dtype=np.int32)
+    holdings = np.zeros((num_games, num_players, len(animal_names)), dtype=np.int8)
+    donkeys_seen = np.zeros(num_games, dtype=np.int8)
+    money_supply = np.empty(len(deck), dtype=np.float64)
+    prices = np.empty((len(deck), num_games), dtype=np.int32)
+
+    for draw in range(len(deck)):
+        cards = order[:, draw]
+        animals = card_animals[cards]
+
+        is_donkey = animals == donkey
+        wallets += (donkey_bonus[donkeys_seen] * is_donkey)[:, None]
+        donkeys_seen += is_donkey
+
+        auctioneer = draw % num_players
+        bidders = (auctioneer + rng.integers(1, num_players, size=num_games)) % num_players
+        price = np.minimum(
+            (card_values[cards] * price_factor).astype(np.int32) // 10 * 10,
+            wallets[games, bidders]
+        )
+        # nobody can pay anything, so the auctioneer keeps the card for free
+        winners = np.where(price > 0, bidders, auctioneer)
+        wallets[games, bidders] -= price
+        wallets[:, auctioneer] += price
+        holdings[games, winners, animals] += 1
+
+        money_supply[draw] = wallets.mean(axis=1).sum()
+        prices[draw] = price
+
+    # each animal ends up with the player holding most of its cards, ties broken at random
+    owners = np.argmax(holdings + rng.random(holdings.shape), axis=1)
+    owned = owners[:, None, :] == np.arange(num_players)[None, :, None]
+    scores = (owned @ animal_values) * owned.sum(axis=2)
+
+    donkey_draws = np.argsort(card_animals[order] != donkey, axis=1, kind='stable')[:, :4]
+    return donkey_draws, money_supply, prices.ravel(), scores
+
+class _Tally:
+    """How many times each non-negative integer has been seen, which is enough to summarize
+    the values without keeping them"""
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, values):
+        counts = np.bincount(np.ravel(values))
+        if len(counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+        self.counts[:len(counts)] += counts
+
+    def summarize(self):
+        """Returns the mean, standard deviation and 5th/50th/95th percentiles of the values,
+        the percentiles interpolated as np.percentile does"""
+
+        values = np.arange(len(self.counts))
+        n = self.counts.sum()
+        mean = (values * self.counts).sum() / n
+        std = np.sqrt(((values - mean) ** 2 * self.counts).sum() / n)
+        # the value at each position of the sorted values
+        ends = np.cumsum(self.counts)
+        p5, p50, p95 = [self._percentile(ends, n, q) for q in (5, 50, 95)]
+        return {
+            'mean': float(mean),
+            'std': float(std),
+            'p5': p5,
+            'p50': p50,
+            'p95': p95,
+        }
+
+    @staticmethod
+    def _percentile(ends, n, q):
+        position = (n - 1) * q / 100
+        below = int(position)
+        low, high = np.searchsorted(ends, [below, min(below + 1, n - 1)], side='right')
+        return float(low + (high - low) * (position - below))
@@ -1,36 +1,125 @@
+from functools import lru_cache
+from operator import ge
 
+# money card denominations, in the order they are held in MoneyCards.cards
+DENOMINATIONS = ('zeros', 'tens', 'twenties', 'fifties', 'hundreds', 'twohundreds', 'fivehundreds')
+VALUES = (0, 10, 20, 50, 100, 200, 500)
 
-class Payment:
-    """Object to transfer payment from one Wallet to another."""
 
-    def __init__(self, zeros=0, tens=0, twenties=0, fifties=0,
-            hundreds=0, twohundreds=0, fivehundreds=0):
-        
-        self.zeros = zeros
-        self.tens = tens
-        self.twenties = twenties
-        self.fifties = fifties
-        self.hundreds = hundreds
-        self.twohundreds = twohundreds
-        self.fivehundreds = fivehundreds
+def valid_payments(cards, total):
+    """Yields each payment, as a denomination vector, that can be made from the vector cards and is
+    worth at least total without a card it could do without. Larger denominations are chosen first,
+    each no more than it takes to reach total, and no more cards are added once total is reached.
+    Zeros are never included."""
+
+    # value of all the cards below each denomination, to skip choices that can't reach total
+    below = [0] * len(cards)
+    for index in range(1, len(cards)):
+        below[index] = below[index - 1] + cards[index - 1] * VALUES[index - 1]
+    chosen = [0] * len(cards)
+
+    def search(index, paid):
+        if paid >= total:
+            yield tuple(chosen)
+            return
+        if index == 0 or paid + below[index] + cards[index] * VALUES[index] < total:
+            return
+        # more of this denomination than it takes to reach total would leave a card spare
+        needed = -(-(total - paid) // VALUES[index])
+        for number in range(min(cards[index], needed), -1, -1):
+            chosen[index] = number
+            yield from search(index - 1, paid + number * VALUES[index])
+        chosen[index] = 0
+
+    yield from search(len(cards) - 1, 0)
+
+@lru_cache(maxsize=4096)
+def best_payment(cards, total):
+    """Returns the payment from the vector cards (a tuple) worth at least total that overpays by
+    the least, using the fewest cards when several do, or None if cards are worth less than total.
+    Memoized, since the same wallets and prices come up again and again."""
+
+    return min(
+        valid_payments(cards, total),
+        key=lambda payment: (sum(n * v for n, v in zip(payment, VALUES)) - total, sum(payment)),
+        default=None
+    )
+
+def _denomination(index):
+    """Returns a property reading and writing the number of cards of one denomination,
+    keeping the cached total and count up to date"""
+
+    value = VALUES[index]
+
+    def get(self):
+        return self.cards[index]
+
+    def set(self, number):
+        change = number - self.cards[index]
+        self.cards[index] = number
+        self._total += change * value
+        self._count += change
+
+    return property(get, set)
+
+
+class MoneyCards:
+    """Fixed vector of money card counts by denomination, with its total value and number
+    of cards kept up to date on every change rather than recomputed when read"""
+
+    __slots__ = ('cards', '_total', '_count')
+
+    zeros = _denomination(0)
+    tens = _denomination(1)
+    twenties = _denomination(2)
+    fifties = _denomination(3)
+    hundreds = _denomination(4)
+    twohundreds = _denomination(5)
+    fivehundreds = _denomination(6)
+
+    def __init__(self, cards):
+        self.cards = list(cards)
+        self._total = sum(n * v for n, v in zip(self.cards, VALUES))
+        self._count = sum(self.cards)
 
     @property
     def total(self):
-        """Returns the sum of the cards in this Payment"""
-        
-        return (
-            self.tens * 10 + \
-            self.twenties * 20 + \
-            self.fifties * 50 + \
-            self.hundreds * 100 + \
-            self.twohundreds * 200 + \
-            self.fivehundreds * 500)
+        """Returns the sum of the cards"""
+
+        return self._total
 
     @property
     def count(self):
-        """Returns the number of cards in this Payment"""
-        
-        return sum(
-            [self.zeros, self.tens, self.twenties, self.fifties,
-            self.hundreds, self.twohundreds, self.fivehundreds]
-        )
\ No newline at end of file
+        """Returns the number of cards"""
+
+        return self._count
+
+    def covers(self, other):
+        """Returns True if there are at least as many cards of each denomination as in other"""
+
+        return all(map(ge, self.cards, other.cards))
+
+    def _add(self, other):
+        """Adds the cards in other"""
+
+        self.cards = [a + b for a, b in zip(self.cards, other.cards)]
+        self._total += other._total
+        self._count += other._count
+
+    def _subtract(self, other):
+        """Removes the cards in other"""
+
+        self.cards = [a - b for a, b in zip(self.cards, other.cards)]
+        self._total -= other._total
+        self._count -= other._count
+
+
+class Payment(MoneyCards):
+    """Object to transfer payment from one Wallet to another."""
+
+    __slots__ = ()
+
+    def __init__(self, zeros=0, tens=0, twenties=0, fifties=0,
+            hundreds=0, twohundreds=0, fivehundreds=0):
+
+        super().__init__((zeros, tens, twenties, fifties, hundreds, twohundreds, fivehundreds))
@@ -1,26 +1,71 @@
+import asyncio
+import secrets
+from . import metrics
+from .deck import CARDS, card_ids
 from .wallet import Wallet
 from .client import Client
+from .state import diff_state
+
+# number of unacknowledged state versions kept per player to diff against
+STATE_HISTORY = 8
 
 class Player:
 
     # constructor
 
-    def __init__(self, websocket, uuid):
+    def __init__(self, websocket, uuid, client=None):
         self.uuid = uuid
         self.name = 'No name yet'
-        self.client = Client(websocket)
-        self.cards = []
+        # index in the order players joined their game, set by Game.add_player
+        self.seat = None
+        self.rejoin_id = None
+        # given to the client to resume its session with after its connection drops, see
+        # Client.resume, and the (resume_token, received) a reconnecting client sent with its name
+        self.resume_token = secrets.token_urlsafe(16)
+        self.resume_request = None
+        # true for server-side bots, see game.bot
+        self.is_bot = False
+        # pay for won auctions with the suggested payment instead of asking the client
+        self.auto_pay = False
+        # seconds the client has to answer each query before a default answer is chosen for
+        # it, or None to wait as long as it takes
+        self.query_timeout = None
+        # types of query whose deadline passed, so a late answer may still turn up
+        self._late_answers = set()
+        self.client = client or Client(websocket)
+        # number of cards held of each animal, by card id, and a bitmask of the ids held
+        self.hand = [0] * len(CARDS)
+        self.hand_mask = 0
+        self._cards = []
         self.completed_sets = []
         self.wallet = Wallet()
+        # states sent to the client that it hasn't acknowledged yet, by version
+        self._unacked_states = {}
+        self._acked_version = None
+        self._acked_state = None
 
     # accessors
 
+    @property
+    def cards(self):
+        """Returns a list of the cards in hand, grouped by animal"""
+
+        if self._cards is None:
+            self._cards = [c for c, held in zip(CARDS, self.hand) for _ in range(held)]
+        return list(self._cards)
+
     def can_trade(self):
         """Returns true if player has incomplete sets"""
         
-        if len(self.cards):
-            return True
-        return False
+        return self.hand_mask != 0
+
+    def count_cards(self, card_name):
+        """Returns the number of cards of the named animal in hand"""
+
+        card_id = card_ids.get(card_name) if isinstance(card_name, str) else None
+        if card_id is None:
+            return 0
+        return self.hand[card_id]
 
     def get_global_state(self):
         """returns a dictionary of player's public-facing data"""
@@ -28,7 +73,7 @@ class Player:
         return {
             'wallet': self.wallet.count,
             'cards': self.cards,
-            'completed_sets': self.completed_sets
+            'completed_sets': list(self.completed_sets)
         }
 
     def get_score(self):
@@ -51,21 +96,42 @@ class Player:
     def add_card(self, card):
         """Adds a card to players cards, and completes a set as necessary"""
         
-        self.cards.append(card)
+        card_id = card_ids[card.name]
+        self.hand[card_id] += 1
+        self.hand_mask |= 1 << card_id
+        self._cards = None
         # check to see if set is completed
-        if self.cards.count(card) == 4:
-            self.completed_sets.append(card)
-            self.cards = [c for c in self.cards if c != card]
+        if self.hand[card_id] == 4:
+            self.completed_sets.append(CARDS[card_id])
+            self.hand[card_id] = 0
+            self.hand_mask &= ~(1 << card_id)
 
     def get_card_by_name(self, card_name):
         """Obtains a card from card list and returns it, removing it from the list"""
         
-        cards_by_name = [c.name for c in self.cards]
-        try:
-            c_index = cards_by_name.index(card_name)
-        except ValueError:
+        if not self.count_cards(card_name):
             raise ValueError(f'Nonexistent card name {card_name} given.')
-        return self.cards.pop(c_index)
+        card_id = card_ids[card_name]
+        self.hand[card_id] -= 1
+        self._cards = None
+        if not self.hand[card_id]:
+            self.hand_mask &= ~(1 << card_id)
+        return CARDS[card_id]
+
+    def replace_client(self, client):
+        """Hands this player over to a new client, e.g. when they reconnect.
+        The next state update is a full snapshot, since the new client has seen none."""
+
+        self.client = client
+        self.reset_state_acks()
+
+    def reset_state_acks(self):
+        """Forgets the states the client has acknowledged, so the next state update is a full
+        snapshot, e.g. when the client may have missed some updates"""
+
+        self._unacked_states = {}
+        self._acked_version = None
+        self._acked_state = None
 
     # IO - methods that provide a wrapper for client object
 
@@ -100,8 +166,12 @@ class Player:
             return 'challenge'
         
         else:        
+            self._discard_late_answers('response')
             await self.client.send_msg('Please choose auction or challenge', 'query')
-            action = await self.client.wait_for_msg('response')
+            action = await self._wait_for_answer('response', self._deadline())
+            if action is None:
+                await self._send_default_notice('you are auctioning')
+                return 'auction'
             if action == 'auction':
                 return 'auction'
             elif action == 'challenge':
@@ -110,35 +180,68 @@ class Player:
                 raise Exception(f'Unknown action {action} returned to player {self.uuid}')
 
     async def create_payment(self, total):
-        """Requests money card combination from client and waits for a message containing the correct amount."""
+        """Requests money card combination from client and waits for a message containing the correct amount.
+        For totals above zero the query carries a suggested payment that overpays least, which the
+        client can send straight back. With auto_pay the suggestion is paid without asking."""
         
-        await self.client.send_msg({
-                'message': f'Please select payment cards that total at least {total}'
-            }, 'query')
+        suggestion = self.wallet.suggest_payment(total) if total else None
+        if suggestion and self.auto_pay:
+            payment = self.wallet.create_payment(suggestion)
+            await self.client.send_msg({
+                'message': f'Paid {payment.total} automatically',
+                'payment': suggestion
+            }, 'message')
+            return payment
+        query = {'message': f'Please select payment cards that total at least {total}'}
+        if suggestion:
+            query['suggestion'] = suggestion
+        self._discard_late_answers('payment')
+        await self.client.send_msg(query, 'query')
+        deadline = self._deadline()
         while True:
-            payload = await self.client.wait_for_msg('payment')
+            payload = await self._wait_for_answer('payment', deadline)
+            if payload is None:
+                # pay the least that covers the total, which for a challenge is no cards at all
+                payment = self.wallet.create_payment(suggestion or {})
+                await self._send_default_notice(f'you paid {payment.total}')
+                return payment
             try:
                 return self.wallet.create_payment(payload)
             except ValueError:
                 await self.client.send_msg(f'You don\'t have those cards! Please select payment cards that total at least {total}', 'query')
 
-    def get_bid(self):
-        """Checks to see if player has made a bid"""
-        
-        msg = self.client.get_msg_by_type('bid')
-        if msg:
-            if self.verify_bid(msg['payload']['amount']):
-                return msg['payload']
-        else:
-            return None
+    def discard_bids(self):
+        """Drops bids and auctioneer bids received before the auction now opening"""
+
+        while self.client.get_msg_by_type('bid'):
+            pass
+        while self.client.get_msg_by_type('auctioneer-bid'):
+            pass
+
+    async def wait_for_bid(self):
+        """Waits until player makes a bid they can afford, then returns it"""
 
-    async def get_challenge(self):
-        """Sends a message to client asking for challenge response, and then waits for the response"""
+        while True:
+            payload = await self.client.wait_for_msg('bid')
+            if self.verify_bid(payload['amount']):
+                return payload
+
+    async def get_challenge(self, opponents=()):
+        """Sends a message to client asking for challenge response, and then waits for the response.
+        If the deadline passes, challenges the first of opponents for the first animal they share."""
         
+        self._discard_late_answers('challenge')
         await self.client.send_msg({
             'message': 'Please select the player and card you wish to challenge'
         }, 'query')
-        return await self.client.wait_for_msg('challenge')
+        payload = await self._wait_for_answer('challenge', self._deadline())
+        if payload is None and opponents:
+            opponent = opponents[0]
+            card_mask = self.hand_mask & opponent.hand_mask
+            card_name = CARDS[(card_mask & -card_mask).bit_length() - 1].name
+            await self._send_default_notice(f'you challenged {opponent.name} for {card_name}')
+            payload = {'player': opponent.name, 'card': card_name}
+        return payload
 
     async def get_challenge_payment(self):
         """Queries client and returns a Payment"""
@@ -149,20 +252,104 @@ class Player:
         """Queries and sets client username"""
         
         await self.client.send_msg('Please enter your username', 'query')
-        payload = await self.client.wait_for_msg('username')
+        payload = await self._wait_for_answer('username', self._deadline())
+        if payload is None:
+            payload = {'username': f'Player {str(self.uuid)[:8]}'}
+            await self._send_default_notice(f'your name is {payload["username"]}')
         self.name = payload['username']
+        # a returning client sends the player id it was given, to take back its seat
+        self.rejoin_id = payload.get('player_id')
+        # and a client whose connection dropped sends its resume token and how many messages it got
+        received = payload.get('received', 0)
+        if payload.get('resume_token') and isinstance(received, int):
+            self.resume_request = (payload['resume_token'], received)
+
+    def _deadline(self):
+        """Returns the event loop time by which the query being sent must be answered, or None"""
+
+        if self.query_timeout is None:
+            return None
+        return asyncio.get_running_loop().time() + self.query_timeout
+
+    async def _wait_for_answer(self, msg_type, deadline):
+        """Waits for the payload of a message of msg_type until deadline, see _deadline.
+        Returns None if the deadline passes first."""
+
+        if deadline is None:
+            return await self.client.wait_for_msg(msg_type)
+        try:
+            return await asyncio.wait_for(
+                self.client.wait_for_msg(msg_type), deadline - asyncio.get_running_loop().time())
+        except asyncio.TimeoutError:
+            metrics.query_timeouts.inc(msg_type)
+            self._late_answers.add(msg_type)
+            return None
+
+    def _discard_late_answers(self, msg_type):
+        """Drops answers to an earlier query of msg_type that arrived after its deadline,
+        so they aren't taken as answers to the next one"""
+
+        if msg_type in self._late_answers:
+            self._late_answers.discard(msg_type)
+            while self.client.get_msg_by_type(msg_type):
+                pass
+
+    async def _send_default_notice(self, outcome):
+        await self.client.send_msg({'message': f'You ran out of time, so {outcome}'}, 'message')
+
+    async def send_error(self, message):
+        """Sends an error message to client"""
+
+        await self.client.send_msg({'message': message}, 'error')
 
     async def send_card(self, card):
         """Accepts a card object and sends a message containing the card to client"""
         
         await self.client.send_msg({'name': card.name, 'value': card.value}, 'card')
     
-    async def update_state(self, global_state):
-        """Updates client with current global game state, plus personal game data"""
+    async def update_state(self, global_state, version=None):
+        """Updates client with current global game state, plus personal game data.
+        When version is given the message is tagged with it, and if the client has acknowledged
+        an earlier version with a state-ack message, only the fields changed since then are sent.
+        A resync message from the client makes the next update a full snapshot."""
 
         state = {
             'my name': self.name,
             'my wallet': self.wallet.to_dict(),
             'global_state': global_state
         }
-        await self.client.send_msg(state, 'state')
+        if version is None:
+            await self.client.send_msg(state, 'state')
+            return
+
+        self._read_state_acks()
+        delta = None
+        if self._acked_state is not None:
+            delta = diff_state(self._acked_state, state)
+        if delta is None:
+            payload = {'version': version, 'full': True, **state}
+        else:
+            payload = {'version': version, 'full': False, 'base': self._acked_version, **delta}
+
+        self._unacked_states[version] = state
+        if len(self._unacked_states) > STATE_HISTORY:
+            del self._unacked_states[min(self._unacked_states)]
+        await self.client.send_msg(payload, 'state')
+
+    def _read_state_acks(self):
+        """Reads any state-ack and resync messages sent by the client since the last update"""
+
+        while msg := self.client.get_msg_by_type('state-ack'):
+            version = msg['payload']['version']
+            if version not in self._unacked_states:
+                continue
+            self._acked_version = version
+            self._acked_state = self._unacked_states[version]
+            self._unacked_states = {
+                v: state for v, state in self._unacked_states.items() if v > version
+            }
+        if self.client.get_msg_by_type('resync'):
+            while self.client.get_msg_by_type('resync'):
+                pass
+            self._acked_version = None
+            self._acked_state = None
@@ -0,0 +1,93 @@
+"""Rebuilds games from their event logs, without sockets or clients.
+
+Run `python -m game.replay path/to/game.jsonl --at N` to print the state of the game
+after its first N events (all of them by default), e.g. when looking into a dispute.
+"""
+
+import argparse
+import json
+from .deck import CARDS, card_ids
+from .events import read
+from .game import Game
+from .local import LocalClient
+from .payment import DENOMINATIONS
+from .player import Player
+
+
+class ReplayError(Exception):
+    """Error for an event log that doesn't match the game it is replayed into"""
+
+
+def replay(events, upto=None):
+    """Returns a Game in the state it was in after the first upto events, or after all of them.
+    The deck is reshuffled from the logged seed, so remaining cards are in their real order."""
+
+    events = events[:upto]
+    if not events or events[0][0] != 'game':
+        raise ReplayError('event log does not start with a game event')
+    _, seed, num_players, auction_timeout = events[0]
+    game = Game(num_players=num_players, auction_timeout=auction_timeout, seed=seed)
+    seats = []
+    for index, event in enumerate(events[1:], 1):
+        try:
+            apply_event(game, seats, event)
+        except (IndexError, KeyError, ValueError) as e:
+            raise ReplayError(f'event {index} {event} could not be applied: {e}') from e
+    game.update_global_state()
+    return game
+
+def apply_event(game, seats, event):
+    """Applies one event to game. seats is the list of players in the order they joined."""
+
+    kind, *args = event
+    if kind == 'join':
+        seat, uuid, name = args
+        if seat != len(seats):
+            raise ValueError(f'expected seat {len(seats)}')
+        player = Player(None, uuid, client=LocalClient(lambda msg_type, msg: None))
+        player.name = name
+        game.add_player(player)
+        seats.append(player)
+    elif kind == 'turn':
+        while game.players[0] is not seats[args[0]]:
+            game.players.rotate()
+    elif kind == 'flip':
+        card = game.deck.pop()
+        if card.name != args[0]:
+            raise ValueError(f'deck dealt a {card.name}')
+        if card.name == 'donkey':
+            for player in game.players:
+                player.wallet.donkey_played()
+    elif kind == 'pay':
+        payer, payee, cards = args
+        payment = seats[payer].wallet.create_payment(dict(zip(DENOMINATIONS, cards)))
+        seats[payee].accept_payment(payment)
+    elif kind == 'card':
+        seat, card_name = args
+        seats[seat].add_card(CARDS[card_ids[card_name]])
+    elif kind == 'challenge':
+        challenger, target, card_name, num_cards, winner = args
+        cards = []
+        for _ in range(num_cards):
+            cards.append(seats[challenger].get_card_by_name(card_name))
+            cards.append(seats[target].get_card_by_name(card_name))
+        for card in cards:
+            seats[winner].add_card(card)
+    # game, bid, auction and end events record what happened without changing state
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the state of a logged game')
+    parser.add_argument('path', help='event log written by the server')
+    parser.add_argument('--at', type=int, default=None, help='number of events to replay')
+    args = parser.parse_args()
+
+    game = replay(read(args.path), args.at)
+    print(json.dumps({
+        'seed': game.seed,
+        'global_state': game.global_state,
+        'wallets': {p.name: p.wallet.to_dict() for p in game.players},
+        'deck': [c.name for c in reversed(game.deck)]
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import json
+import os
+from .events import submit
+from .state import diff_state, merge_state
+
+# deltas appended to a snapshot file before it is rewritten as one full snapshot
+FULL_EVERY = 50
+
+
+def load(path):
+    """Returns the game state stored in the snapshot file at path, for Game.from_snapshot.
+    A last line left half written by a crash is ignored, leaving the state as of the turn before."""
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    state = None
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break
+        state = record if state is None else merge_state(state, record)
+    return state
+
+
+class Snapshotter:
+    """Saves a game's state to one file at each turn boundary, so it survives the server restarting.
+    The first snapshot is written in full and each later one appends only what changed as a
+    delta line, until FULL_EVERY deltas have built up and the file is rewritten in full.
+    Writes happen on the background writer thread shared with event logs."""
+
+    enabled = True
+
+    def __init__(self, path, full_every=FULL_EVERY):
+        self.path = path
+        self.full_every = full_every
+        self._last = None
+        self._deltas = 0
+
+    def snapshot(self, game):
+        """Queues a write of game's current state"""
+
+        state = game.to_snapshot()
+        delta = None
+        if self._last is not None and self._deltas < self.full_every:
+            delta = diff_state(self._last, state)
+            if delta == {}:
+                return
+        if delta is None:
+            # the first snapshot, one due in full, or a change a delta can't express
+            submit(self._write_full, json.dumps(state, separators=(',', ':')))
+            self._deltas = 0
+        else:
+            submit(self._append, json.dumps(delta, separators=(',', ':')))
+            self._deltas += 1
+        self._last = state
+
+    def remove(self):
+        """Queues removal of the snapshot file, once the game has ended and can't be resumed"""
+
+        self._last = None
+        submit(self._remove)
+
+    def _write_full(self, data):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # replace the old file in one step, so a crash leaves either the old or the new snapshot
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data + '\n')
+        os.replace(tmp_path, self.path)
+
+    def _append(self, data):
+        with open(self.path, 'a') as f:
+            f.write(data + '\n')
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class NullSnapshotter:
+    """Snapshotter for games that aren't saved"""
+
+    enabled = False
+
+    def snapshot(self, game):
+        pass
+
+    def remove(self):
+        pass
+
+
+NULL_SNAPSHOTTER = NullSnapshotter()
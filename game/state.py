@@ -0,0 +1,33 @@
+def diff_state(old, new):
+    """Returns the parts of dict new that differ from dict old, recursing into nested dicts.
+    Applying the result to old with merge_state gives new. Returns None if new is missing
+    a key that old has, since removals can't be expressed as a delta."""
+
+    if old.keys() - new.keys():
+        return None
+    delta = {}
+    for key, value in new.items():
+        if key not in old:
+            delta[key] = value
+            continue
+        old_value = old[key]
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            nested = diff_state(old_value, value)
+            if nested is None:
+                return None
+            if nested:
+                delta[key] = nested
+        elif value != old_value:
+            delta[key] = value
+    return delta
+
+def merge_state(state, delta):
+    """Returns a copy of dict state with delta (as produced by diff_state) applied"""
+
+    merged = dict(state)
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_state(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
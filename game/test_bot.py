@@ -0,0 +1,90 @@
+import random
+import unittest
+from game.async_test_helper import run_async
+from game.bot import BotAgent, create_bot
+from game.deck import CARDS
+from game.local import SimpleAgent, play_local_game
+from game.wallet import Wallet
+
+
+def state(hands, wallet=None):
+    """Returns a state message payload for agents named by hands, which maps names to animals"""
+
+    return {
+        'my wallet': (wallet or Wallet()).to_dict(),
+        'global_state': {
+            'players': list(hands),
+            **{
+                name: {'cards': [c for c in CARDS for animal in animals if c.name == animal]}
+                for name, animals in hands.items()
+            }
+        }
+    }
+
+
+class TestBot(unittest.TestCase):
+
+    def setUp(self):
+        self.bot = BotAgent('bot', random.Random(0))
+
+    def test_create_bot(self):
+        player = create_bot('Bot 1')
+        self.assertEqual(player.name, 'Bot 1')
+        self.assertTrue(player.is_bot)
+        self.assertEqual(player.client.wire_format, 'local')
+
+    def test_bids_more_for_animals_it_holds(self):
+        self.bot('state', state({'bot': [], 'frodo': []}))
+        limit = self.bot.bid_limit('cow', 800)
+        self.bot('state', state({'bot': ['cow', 'cow'], 'frodo': []}))
+        self.assertGreater(self.bot.bid_limit('cow', 800), limit)
+        self.assertLessEqual(self.bot.bid_limit('cow', 800), self.bot.wallet_total() * 0.8)
+
+    def test_bids_to_stop_a_set(self):
+        self.bot('state', state({'bot': [], 'frodo': []}))
+        limit = self.bot.bid_limit('duck', 40)
+        self.bot('state', state({'bot': [], 'frodo': ['duck'] * 3}))
+        self.assertGreater(self.bot.bid_limit('duck', 40), limit)
+
+    def test_raises_bid_up_to_limit(self):
+        self.bot('state', state({'bot': [], 'frodo': [], 'sam': []}))
+        self.bot('card', {'name': 'horse', 'value': 1000})
+        self.bot('bid', {'bid': 0, 'player': 'frodo'})
+        self.assertEqual(self.bot('bid', {'bid': 10, 'player': 'sam'}), ('bid', {'amount': 20}))
+        self.assertIsNone(self.bot('bid', {'bid': 90, 'player': 'sam'}))
+
+    def test_auctioneer_matches_cheap_bid(self):
+        self.bot('state', state({'bot': [], 'frodo': []}))
+        self.bot('card', {'name': 'horse', 'value': 1000})
+        self.bot('bid', {'bid': 0, 'player': 'bot'})
+        self.assertEqual(
+            self.bot('bid', {'bid': 20, 'player': 'frodo'}), ('auctioneer-bid', {'amount': 20}))
+        self.assertIsNone(self.bot('bid', {'bid': 90, 'player': 'frodo'}))
+
+    def test_challenges_for_most_valuable_shared_animal(self):
+        self.bot('state', state({
+            'bot': ['cow', 'duck'], 'frodo': ['duck', 'cow', 'cow'], 'sam': ['cow', 'duck']
+        }))
+        self.assertEqual(self.bot.choose_challenge(), {'player': 'sam', 'card': 'cow'})
+        # offers money for the cow when asked for challenge payment
+        payment = self.bot.choose_payment(0)
+        self.assertGreater(sum(payment.values()), 0)
+
+    def test_offers_money_when_challenged(self):
+        self.bot('state', state({'bot': ['horse'], 'frodo': ['horse']}))
+        self.bot('message', {'message': 'frodo has challenged bot for a horse with 2 money cards.'})
+        self.assertEqual(self.bot.challenged_for, 'horse')
+        self.bot('message', {'message': 'frodo has challenged bot for all the cows with 2 money cards.'})
+        self.assertEqual(self.bot.challenged_for, 'cow')
+
+    def test_bot_beats_simple_agents(self):
+        wins = 0
+        for seed in range(20):
+            agents = [BotAgent('bot', random.Random(seed)), SimpleAgent('frodo', random.Random(seed)),
+                SimpleAgent('sam', random.Random(seed))]
+            scores = run_async(play_local_game, agents, 0, seed)
+            wins += max(scores, key=scores.get) == 'bot'
+        self.assertGreater(wins, 10)
+
+if __name__ == '__main__':
+    unittest.main()
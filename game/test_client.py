@@ -1,9 +1,11 @@
 import asyncio
 import unittest
 import json
+import time
 from uuid import uuid4
 from string import ascii_lowercase
-from game.client import Client
+from game import codec
+from game.client import MSG_QUEUE_SIZE, Client, ClientDisconnectError
 from game.player import Player
 from game.mock_socket import MockSocket
 from game.async_test_helper import run_async
@@ -36,6 +38,7 @@ class TestClient(unittest.TestCase):
     def test_private_send_msg(self):
         msg = {'type': 'test'}
         run_async(self.client._send_msg, msg)
+        run_async(self.client.flush)
         sent_msg = self.sock.msg_queue[0]
         decoded_msg = json.loads(sent_msg)
         self.assertEqual(decoded_msg['type'], msg['type'])
@@ -44,6 +47,7 @@ class TestClient(unittest.TestCase):
         msg = 'hi, test message here!'
         msg_type = 'test'
         run_async(self.client.send_msg, msg, msg_type)
+        run_async(self.client.flush)
         sent_msg = self.sock.msg_queue[0]
         decoded_msg = json.loads(sent_msg)
         self.assertEqual(decoded_msg['type'], msg_type)
@@ -54,6 +58,7 @@ class TestClient(unittest.TestCase):
 
     def test_get_msg(self):
         msg_dict = {
+            "type": "bid",
             "a": "foo",
             "2": "spam"
         }
@@ -71,24 +76,24 @@ class TestClient(unittest.TestCase):
         )
 
     def test_get_msg_by_type_finds_correct_message(self):
-        msgs = [json.dumps({'type': 'test', 'payload': c}) for c in ascii_lowercase]
-        msgs.append(json.dumps({'type': 'important', 'payload': '!'}))
+        msgs = [json.dumps({'type': 'response', 'payload': c}) for c in ascii_lowercase]
+        msgs.append(json.dumps({'type': 'challenge', 'payload': '!'}))
         self.sock.push_to_queue(msgs)
         run_async(self.client.handle_msgs, False)
-        result = self.client.get_msg_by_type('important')
+        result = self.client.get_msg_by_type('challenge')
         self.assertTrue(result)
         self.assertEqual(
-            result['type'], 'important'
+            result['type'], 'challenge'
         )
         self.assertEqual(
             result['payload'], '!'
         )
 
     def test_get_msg_by_type_returns_false_when_msg_is_missing(self):
-        msgs = [json.dumps({'type': 'test', 'payload': c}) for c in ascii_lowercase]
+        msgs = [json.dumps({'type': 'response', 'payload': c}) for c in ascii_lowercase]
         self.sock.push_to_queue(msgs)
         run_async(self.client.handle_msgs, False)
-        result = self.client.get_msg_by_type('important')
+        result = self.client.get_msg_by_type('challenge')
         self.assertFalse(result)
 
     def test_get_msg_by_type_returns_false_on_empty_queue(self):
@@ -96,8 +101,276 @@ class TestClient(unittest.TestCase):
         result = self.client.get_msg_by_type('any')
         self.assertFalse(result)       
 
+    def test_get_msg_by_type_keeps_other_messages(self):
+        msgs = [json.dumps({'type': 'bid', 'payload': {'amount': 10}})]
+        msgs.append(json.dumps({'type': 'payment', 'payload': {}}))
+        self.sock.push_to_queue(msgs)
+        run_async(self.client.handle_msgs, False)
+        self.assertTrue(self.client.get_msg_by_type('payment'))
+        result = self.client.get_msg_by_type('bid')
+        self.assertTrue(result)
+        self.assertEqual(result['payload']['amount'], 10)
+
+    def test_get_msg_returns_oldest_of_any_type(self):
+        msgs = [json.dumps({'type': t, 'payload': t}) for t in ['bid', 'payment', 'bid']]
+        self.sock.push_to_queue(msgs)
+        run_async(self.client.handle_msgs, False)
+        self.assertEqual(self.client.get_msg()['type'], 'bid')
+        self.assertEqual(self.client.get_msg()['type'], 'payment')
+        self.assertEqual(self.client.get_msg()['type'], 'bid')
+        self.assertFalse(self.client.get_msg())
+
+    def test_drops_messages_the_game_never_reads(self):
+        msgs = [json.dumps({'type': t, 'payload': 1}) for t in ['emote', 'bid', 'payment']]
+        msgs += [json.dumps({'type': {'not': 'hashable'}}), json.dumps(['bid'])]
+        self.sock.push_to_queue(msgs)
+        run_async(self.client.handle_msgs, False)
+        self.assertEqual(self.client.queue_depth, 2)
+        self.assertEqual(self.client.get_msg()['type'], 'bid')
+
+    def test_unread_messages_are_capped_per_type(self):
+        msgs = [json.dumps({'type': 'bid', 'payload': i}) for i in range(MSG_QUEUE_SIZE + 5)]
+        self.sock.push_to_queue(msgs)
+        run_async(self.client.handle_msgs, False)
+        self.assertEqual(self.client.queue_depth, MSG_QUEUE_SIZE)
+        # the oldest are dropped
+        self.assertEqual(self.client.get_msg()['payload'], 5)
+
     def test_wait_for_message(self):
-        pass
+        msg = json.dumps({'type': 'username', 'payload': {'username': 'bilbo'}})
+        self.sock.push_to_queue([msg])
+        run_async(self.client.handle_msgs, False)
+        payload = run_async(self.client.wait_for_msg, 'username')
+        self.assertEqual(payload['username'], 'bilbo')
+
+    def test_wait_for_message_wakes_on_arrival(self):
+        async def wait_then_receive():
+            waiter = asyncio.create_task(self.client.wait_for_msg('payment'))
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            self.sock.push_to_queue([
+                json.dumps({'type': 'bid', 'payload': {'amount': 10}}),
+                json.dumps({'type': 'payment', 'payload': {'tens': 1}})
+            ])
+            await self.client.handle_msgs(False)
+            return await asyncio.wait_for(waiter, 1)
+
+        payload = run_async(wait_then_receive)
+        self.assertEqual(payload, {'tens': 1})
+        # the bid that arrived first is still available
+        self.assertTrue(self.client.get_msg_by_type('bid'))
+
+    def test_binary_client_sends_and_receives_frames(self):
+        sock = MockSocket(time_delay=0)
+        sock.subprotocol = codec.SUBPROTOCOL
+        client = Client(sock)
+        self.assertEqual(client.wire_format, 'binary')
+        run_async(client.send_msg, {'name': 'cow', 'value': 800}, 'card')
+        run_async(client.flush)
+        self.assertEqual(codec.decode(sock.msg_queue[0])['payload']['name'], 'cow')
+        sock.push_to_queue([
+            codec.encode('bid', {'amount': 40}),
+            json.dumps({'type': 'state-ack', 'payload': {'version': 1}})
+        ])
+        run_async(client.handle_msgs, False)
+        self.assertEqual(client.get_msg_by_type('bid')['payload'], {'amount': 40})
+        self.assertTrue(client.get_msg_by_type('state-ack'))
+
+    def test_malformed_frames_are_dropped(self):
+        self.sock.push_to_queue([
+            bytes((5, 1)), '{"type": "bid"', codec.encode('bid', {'amount': 40})
+        ])
+        run_async(self.client.handle_msgs, False)
+        self.assertEqual(self.client.get_msg(), {'type': 'bid', 'payload': {'amount': 40}})
+        self.assertFalse(self.client.get_msg())
+
+    def test_json_is_the_default_wire_format(self):
+        self.assertEqual(self.client.wire_format, 'json')
+
+    def test_send_returns_before_socket_write(self):
+        async def send():
+            start = time.monotonic()
+            for i in range(3):
+                await self.client.send_msg(i, 'message')
+            elapsed = time.monotonic() - start
+            self.assertEqual(self.client.send_queue_depth, 3)
+            await self.client.flush()
+            return elapsed
+
+        # the socket takes 0.1 seconds per message
+        self.assertLess(run_async(send), 0.05)
+        self.assertEqual([json.loads(m)['payload'] for m in self.sock.msg_queue], [0, 1, 2])
+
+    def test_full_queue_coalesces_state_messages(self):
+        client = Client(MockSocket(time_delay=1), send_queue_size=2)
+
+        async def send():
+            await client.send_msg(1, 'state')
+            # let the writer start on the first message
+            await asyncio.sleep(0)
+            for msg, msg_type in [('a', 'message'), (2, 'state'), (3, 'state')]:
+                await client.send_msg(msg, msg_type)
+            queued = [json.loads(data)['payload'] for _, data in client._send_queue]
+            client._writer.cancel()
+            return queued
+
+        # the first state is already being written, the second is replaced by the third
+        self.assertEqual(run_async(send), ['a', 3])
+        self.assertFalse(client.disconnected)
+
+    def test_full_queue_keeps_newest_state(self):
+        client = Client(MockSocket(time_delay=1), send_queue_size=2)
+
+        async def send():
+            await client.send_msg('a', 'message')
+            await asyncio.sleep(0)
+            for msg, msg_type in [(1, 'state'), (2, 'state'), ('b', 'message')]:
+                await client.send_msg(msg, msg_type)
+            queued = [json.loads(data)['payload'] for _, data in client._send_queue]
+            client._writer.cancel()
+            return queued
+
+        self.assertEqual(run_async(send), [2, 'b'])
+
+    def test_full_queue_disconnects_slow_client(self):
+        sock = MockSocket(time_delay=1)
+        client = Client(sock, send_queue_size=2, full_queue_policy='disconnect')
+
+        async def send():
+            waiter = asyncio.create_task(client.wait_for_msg('bid'))
+            await client.send_msg(0, 'state')
+            await asyncio.sleep(0)
+            for i in range(1, 3):
+                await client.send_msg(i, 'state')
+            with self.assertRaises(ClientDisconnectError):
+                await client.send_msg(3, 'state')
+            with self.assertRaises(ClientDisconnectError):
+                await waiter
+            await asyncio.sleep(0)
+
+        run_async(send)
+        self.assertTrue(client.disconnected)
+        self.assertEqual(sock.close_code, 1008)
+        self.assertEqual(client.send_queue_depth, 0)
+        with self.assertRaises(ClientDisconnectError):
+            run_async(client.send_msg, 'hi', 'message')
+        with self.assertRaises(ClientDisconnectError):
+            run_async(client.wait_for_msg, 'bid')
+
+    def test_unknown_full_queue_policy(self):
+        with self.assertRaises(ValueError):
+            Client(MockSocket(), full_queue_policy='block')
+
+    def test_clean_close_disconnects_client(self):
+        self.sock.closed = True
+        run_async(self.client.handle_msgs, False)
+        self.assertTrue(self.client.disconnected)
+        with self.assertRaises(ClientDisconnectError):
+            run_async(self.client.wait_for_msg, 'bid')
+
+    def test_dropped_connection_suspends_resumable_client(self):
+        sock = MockSocket(time_delay=0)
+        sock.closed = True
+        client = Client(sock, resume_time=0.05)
+
+        async def drop():
+            await client.handle_msgs(False)
+            self.assertTrue(client.suspended)
+            self.assertFalse(client.disconnected)
+            # messages sent while suspended are kept for replaying, not written
+            await client.send_msg('missed', 'message')
+            self.assertEqual(client.send_queue_depth, 0)
+            with self.assertRaises(ClientDisconnectError):
+                await client.wait_for_msg('bid')
+
+        run_async(drop)
+        self.assertTrue(client.disconnected)
+        self.assertFalse(client.suspended)
+
+    def test_resume_replays_missed_messages(self):
+        old_sock = MockSocket(time_delay=0)
+        client = Client(old_sock, resume_time=1)
+
+        async def resume():
+            for i in range(3):
+                await client.send_msg(i, 'message')
+            await client.flush()
+            old_sock.closed = True
+            await client.handle_msgs(False)
+            await client.send_msg(3, 'message')
+            new_sock = MockSocket(time_delay=0)
+            # the client got the first two messages before its connection dropped
+            self.assertIs(client.resume(new_sock, 2), True)
+            self.assertFalse(client.suspended)
+            await client.send_msg(4, 'message')
+            await client.flush()
+            return [json.loads(m) for m in new_sock.msg_queue]
+
+        msgs = run_async(resume)
+        self.assertEqual(msgs[0], {'type': 'resumed', 'payload': {'next': 2}})
+        self.assertEqual([m['payload'] for m in msgs[1:]], [2, 3, 4])
+        self.assertEqual(old_sock.close_code, 1000)
+
+    def test_resume_reports_messages_too_old_to_replay(self):
+        client = Client(MockSocket(time_delay=0), resume_time=1, replay_buffer_size=2)
+
+        async def resume():
+            for i in range(4):
+                await client.send_msg(i, 'message')
+            new_sock = MockSocket(time_delay=0)
+            complete = client.resume(new_sock, 1)
+            await client.flush()
+            return complete, [json.loads(m)['payload'] for m in new_sock.msg_queue]
+
+        self.assertEqual(run_async(resume), (False, [{'next': 2}, 2, 3]))
+
+    def test_resume_after_coalescing_replays_nothing_twice(self):
+        client = Client(MockSocket(time_delay=0), send_queue_size=2, resume_time=1)
+
+        async def resume():
+            await client.send_msg('Please choose auction or challenge', 'query')
+            # the first state is made stale by the second before either is written
+            for version in range(2):
+                await client.send_msg({'version': version}, 'state')
+            await client.flush()
+            written = [json.loads(m)['type'] for m in client._websocket.msg_queue]
+            self.assertEqual(written, ['query', 'state'])
+            new_sock = MockSocket(time_delay=0)
+            self.assertIs(client.resume(new_sock, len(written)), True)
+            await client.flush()
+            return [json.loads(m) for m in new_sock.msg_queue]
+
+        self.assertEqual(run_async(resume), [{'type': 'resumed', 'payload': {'next': 2}}])
+
+    def test_resume_replays_no_more_than_half_the_send_queue(self):
+        old_sock = MockSocket(time_delay=0)
+        old_sock.closed = True
+        client = Client(old_sock, send_queue_size=4, full_queue_policy='disconnect',
+            resume_time=1, replay_buffer_size=100)
+
+        async def resume():
+            await client.handle_msgs(False)
+            # sent while the client is suspended
+            for i in range(10):
+                await client.send_msg(i, 'message')
+            new_sock = MockSocket(time_delay=0)
+            complete = client.resume(new_sock, 0)
+            # e.g. the full state sent after a replay with a gap
+            await client.send_msg('state', 'state')
+            await client.flush()
+            return complete, [json.loads(m)['payload'] for m in new_sock.msg_queue]
+
+        self.assertEqual(run_async(resume), (False, [{'next': 8}, 8, 9, 'state']))
+        self.assertFalse(client.disconnected)
+
+    def test_resume_refused(self):
+        self.assertIsNone(self.client.resume(MockSocket(), 0))
+        client = Client(MockSocket(), resume_time=1)
+        binary_sock = MockSocket()
+        binary_sock.subprotocol = codec.SUBPROTOCOL
+        self.assertIsNone(client.resume(binary_sock, 0))
+        client._set_disconnected()
+        self.assertIsNone(client.resume(MockSocket(), 0))
 
 if __name__ == "__main__":
     unittest.main()
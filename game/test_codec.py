@@ -0,0 +1,100 @@
+import json
+import unittest
+from game import codec
+from game.deck import CARDS
+from game.wallet import Wallet
+
+
+def json_round_trip(msg_type, payload):
+    return json.loads(json.dumps({'type': msg_type, 'payload': payload}))
+
+
+class TestCodec(unittest.TestCase):
+
+    def assertRoundTrips(self, msg_type, payload):
+        self.assertEqual(
+            codec.decode(codec.encode(msg_type, payload)),
+            json_round_trip(msg_type, payload)
+        )
+
+    def test_fixed_layouts(self):
+        self.assertEqual(len(codec.encode('bid', {'amount': 40})), 5)
+        self.assertEqual(len(codec.encode('state-ack', {'version': 7})), 5)
+        self.assertEqual(codec.encode('card', {'name': 'cow', 'value': 800}), bytes((4, 8)))
+        self.assertEqual(len(codec.encode('payment', {'tens': 2, 'fifties': 1})), 8)
+        for msg_type, payload in [
+            ('bid', {'amount': 40}),
+            ('auctioneer-bid', {'amount': 90}),
+            ('state-ack', {'version': 7}),
+            ('card', {'name': 'cow', 'value': 800}),
+            ('payment', {'tens': 2, 'fifties': 1}),
+            ('payment', {}),
+        ]:
+            self.assertRoundTrips(msg_type, payload)
+
+    def test_payloads_not_fitting_fixed_layout(self):
+        for msg_type, payload in [
+            ('bid', {'amount': -5}),
+            ('bid', {'amount': '40'}),
+            ('bid', {'bid': 40, 'player': 'frodo'}),
+            ('card', {'name': 'cow', 'value': 1}),
+            ('card', {'name': 'phoenix', 'value': 800}),
+            ('payment', {'tens': 300}),
+            ('payment', {'coins': 2}),
+            ('payment', 'all of it'),
+            ('state-ack', {'version': 2 ** 40}),
+        ]:
+            self.assertRoundTrips(msg_type, payload)
+
+    def test_tagged_values(self):
+        self.assertRoundTrips('message', {
+            'message': 'hello ünïcode',
+            'numbers': [0, -1, 1, 127, 128, -300, 2 ** 64, 1.5],
+            'flags': [True, False, None],
+            'nested': {'a': {'b': []}, 'c': ''}
+        })
+        self.assertRoundTrips('query', 'Please choose auction or challenge')
+        self.assertRoundTrips('game-over', {'frodo': 1600, 'sam': 0})
+
+    def test_unknown_message_type(self):
+        self.assertRoundTrips('emote', {'emote': 'moo'})
+
+    def test_malformed_frames(self):
+        for data in [
+            b'',
+            bytes((200,)),
+            # a bid too short for its amount
+            bytes((5, 1)),
+            # a message with no fixed layout
+            bytes((1, 2)),
+            # a tagged payload cut short, and one with an unknown tag
+            bytes((1, 0xff, codec.STR, 5)) + b'ab',
+            bytes((1, 0xff, 99)),
+            bytes((1, 0xff)) + bytes((codec.LIST, 1)) * 5000,
+        ]:
+            with self.assertRaises(codec.CodecError):
+                codec.decode(data)
+
+    def test_state_with_wallets_and_hands(self):
+        cow, horse = CARDS[8], CARDS[9]
+        state = {
+            'version': 1,
+            'full': True,
+            'my name': 'frodo',
+            'my wallet': Wallet().to_dict(),
+            'global_state': {
+                'players': ['frodo'],
+                'frodo': {'wallet': 7, 'cards': [cow, cow, horse], 'completed_sets': [horse, cow]},
+                'deck_count': 35
+            }
+        }
+        self.assertRoundTrips('state', state)
+        # hand and wallet are sent as fixed counts, far smaller than the JSON
+        self.assertLess(len(codec.encode('state', state)), len(json.dumps(state)) / 3)
+
+    def test_unordered_hand_is_sent_as_list(self):
+        cow, horse = CARDS[8], CARDS[9]
+        self.assertRoundTrips('state', {'cards': [horse, cow]})
+
+if __name__ == '__main__':
+    unittest.main()
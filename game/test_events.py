@@ -0,0 +1,100 @@
+import asyncio
+import os
+import random
+import tempfile
+import unittest
+from game import events
+from game.async_test_helper import run_async
+from game.events import EventLog
+from game.game import Game
+from game.local import LocalClient, SimpleAgent
+from game.player import Player
+from game.replay import ReplayError, replay
+
+
+async def play_logged_game(path):
+    game = Game(num_players=3, auction_timeout=0, seed=7, event_log=EventLog(path))
+    for i, name in enumerate(['frodo', 'sam', 'pippin']):
+        player = Player(None, str(i), client=LocalClient(SimpleAgent(name, random.Random(i))))
+        await player.get_name()
+        game.add_player(player)
+    await game.run()
+    return game
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'logs', 'game.jsonl')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_events_are_written_on_flush(self):
+        log = EventLog(self.path)
+        log.append('flip', 'cow')
+        self.assertFalse(os.path.exists(self.path))
+        log.append('bid', 1, 40)
+        run_async(log.close)
+        self.assertEqual(events.read(self.path), [['flip', 'cow'], ['bid', 1, 40]])
+
+    def test_flushes_append(self):
+        log = EventLog(self.path)
+        log.append('turn', 0)
+        log.flush()
+        log.append('turn', 1)
+        run_async(log.close)
+        self.assertEqual(events.read(self.path), [['turn', 0], ['turn', 1]])
+
+    def test_cancelled_game_drops_events_of_unfinished_turn(self):
+        async def cancel_mid_auction():
+            game = Game(num_players=3, auction_timeout=1, seed=7, event_log=EventLog(self.path))
+            for i, name in enumerate(['frodo', 'sam', 'pippin']):
+                player = Player(None, str(i), client=LocalClient(SimpleAgent(name, random.Random(i))))
+                await player.get_name()
+                game.add_player(player)
+            task = asyncio.create_task(game.run())
+            while len(game.deck) == 40:
+                await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        run_async(cancel_mid_auction)
+        self.assertEqual([e[0] for e in events.read(self.path)], ['game'] + ['join'] * 3)
+
+    def test_replay_rebuilds_finished_game(self):
+        game = run_async(play_logged_game, self.path)
+        log = events.read(self.path)
+        self.assertEqual(log[0], ['game', 7, 3, 0])
+        self.assertEqual(log[-1], ['end', 'complete'])
+        self.assertIn('challenge', {e[0] for e in log})
+
+        replayed = replay(log)
+        self.assertEqual(replayed.seed, game.seed)
+        for player in game.players:
+            other = next(p for p in replayed.players if p.name == player.name)
+            self.assertEqual(other.wallet.to_dict(), player.wallet.to_dict())
+            self.assertEqual(other.cards, player.cards)
+            self.assertEqual(other.completed_sets, player.completed_sets)
+            self.assertEqual(other.get_score(), player.get_score())
+
+    def test_replay_to_event_index(self):
+        run_async(play_logged_game, self.path)
+        log = events.read(self.path)
+        first_flip = next(i for i, e in enumerate(log) if e[0] == 'flip')
+        before = replay(log, first_flip)
+        after = replay(log, first_flip + 1)
+        self.assertEqual(len(before.deck), 40)
+        self.assertEqual(len(after.deck), 39)
+        self.assertEqual(before.global_state['players'], ['frodo', 'sam', 'pippin'])
+
+    def test_replay_with_wrong_seed_fails(self):
+        run_async(play_logged_game, self.path)
+        log = events.read(self.path)
+        log[0] = ['game', 8, 3, 0]
+        with self.assertRaises(ReplayError):
+            replay(log)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import random
+import unittest
+from game.async_test_helper import run_async
+from game.game import Game
+from game.local import LocalClient, SimpleAgent, play_local_game
+from game.player import Player
+
+
+class TestLocal(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+
+    def echo_agent(self, msg_type, payload):
+        self.received.append((msg_type, payload))
+        if msg_type == 'query':
+            return 'response', payload
+        return None
+
+    def test_local_client_passes_objects_to_agent(self):
+        client = LocalClient(self.echo_agent)
+        payload = {'name': 'horse', 'value': 1000}
+        run_async(client.send_msg, payload, 'card')
+        self.assertIs(self.received[0][1], payload)
+
+    def test_local_client_routes_agent_response(self):
+        client = LocalClient(self.echo_agent)
+        run_async(client.send_msg, 'auction', 'query')
+        self.assertEqual(run_async(client.wait_for_msg, 'response'), 'auction')
+
+    def test_auction_with_zero_timeout_takes_agent_bids(self):
+        game = Game(auction_timeout=0)
+        for i in range(3):
+            agent = SimpleAgent(f'agent {i}')
+            player = Player(None, i, client=LocalClient(agent))
+            run_async(player.get_name)
+            game.add_player(player)
+        run_async(game.push_state)
+        run_async(game.push_all, {'name': 'cow', 'value': 800}, 'card')
+        results, bidwinner, payee = run_async(game.auction)
+        # both bidders open at 80, and neither can afford to raise to 160
+        self.assertEqual(results['bid'], 80)
+        self.assertNotEqual(bidwinner, game.players[0])
+        self.assertEqual(payee, game.players[0])
+
+    def test_play_local_game(self):
+        agents = [SimpleAgent(name) for name in ['frodo', 'sam', 'pippin']]
+        scores = run_async(play_local_game, agents)
+        self.assertEqual(set(scores), {'frodo', 'sam', 'pippin'})
+        self.assertGreater(sum(scores.values()), 0)
+
+    def test_play_local_game_replays_with_seed(self):
+        def play():
+            agents = [SimpleAgent(name, random.Random(i)) for i, name in enumerate(['frodo', 'sam'])]
+            return run_async(play_local_game, agents, 0, 1234)
+        self.assertEqual(play(), play())
+
+if __name__ == '__main__':
+    unittest.main()
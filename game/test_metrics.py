@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from game import metrics
+from game.async_test_helper import run_async
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        # keep test metrics out of the module registry
+        self.registry = list(metrics.registry)
+
+    def tearDown(self):
+        metrics.registry[:] = self.registry
+
+    def test_counter_counts_by_label(self):
+        counter = metrics.Counter('test_total', 'Test counter', 'type')
+        counter.inc('bid')
+        counter.inc('bid')
+        counter.inc('payment', 3)
+        lines = counter.render()
+        self.assertIn('test_total{type="bid"} 2', lines)
+        self.assertIn('test_total{type="payment"} 3', lines)
+
+    def test_counter_groups_excess_label_values(self):
+        counter = metrics.Counter('test_total', 'Test counter', 'type')
+        for i in range(metrics.MAX_LABEL_VALUES + 5):
+            counter.inc(str(i))
+        self.assertEqual(len(counter.values), metrics.MAX_LABEL_VALUES + 1)
+        self.assertEqual(counter.values['other'], 5)
+
+    def test_label_values_are_escaped(self):
+        counter = metrics.Counter('test_total', 'Test counter', 'type')
+        counter.inc('say "hi"')
+        self.assertIn('test_total{type="say \\"hi\\""} 1', counter.render())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram', (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count 4', lines)
+
+    def test_serve(self):
+        async def scrape():
+            server = await metrics.serve(port=0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response.decode()
+
+        response = run_async(scrape)
+        self.assertTrue(response.startswith('HTTP/1.1 200 OK'))
+        self.assertIn('# TYPE kuhhandel_games_created_total counter', response)
+
+if __name__ == '__main__':
+    unittest.main()
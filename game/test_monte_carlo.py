@@ -0,0 +1,46 @@
+import unittest
+from game import monte_carlo
+from game.wallet import Wallet
+
+
+@unittest.skipIf(monte_carlo.np is None, 'numpy is not installed')
+class TestMonteCarlo(unittest.TestCase):
+
+    def setUp(self):
+        self.results = monte_carlo.simulate(1000, seed=7, batch_size=300)
+
+    def test_same_seed_gives_same_results(self):
+        self.assertEqual(monte_carlo.simulate(1000, seed=7, batch_size=300), self.results)
+
+    def test_donkeys_appear_in_draw_order(self):
+        means = [d['mean'] for d in self.results['donkey_draw']]
+        self.assertEqual(len(means), 4)
+        self.assertEqual(means, sorted(means))
+
+    def test_money_supply_includes_every_donkey_payout(self):
+        wallet = Wallet()
+        for _ in range(4):
+            wallet.donkey_played()
+        supply = self.results['money_supply']
+        self.assertEqual(len(supply), 40)
+        self.assertAlmostEqual(supply[-1], wallet.total)
+
+    def test_winning_margin_is_within_winning_score(self):
+        self.assertGreaterEqual(self.results['score']['p5'], 0)
+        self.assertLessEqual(
+            self.results['winning_margin']['mean'],
+            self.results['winning_score']['mean']
+        )
+
+    def test_tally_summarizes_like_numpy(self):
+        values = monte_carlo.np.random.default_rng(0).integers(0, 500, size=(3, 1001))
+        tally = monte_carlo._Tally()
+        for row in values:
+            tally.add(row)
+        p5, p50, p95 = monte_carlo.np.percentile(values, [5, 50, 95])
+        expected = {'mean': values.mean(), 'std': values.std(), 'p5': p5, 'p50': p50, 'p95': p95}
+        for key, value in tally.summarize().items():
+            self.assertAlmostEqual(value, expected[key])
+
+if __name__ == '__main__':
+    unittest.main()
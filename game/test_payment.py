@@ -70,5 +70,23 @@ class TestPayment(unittest.TestCase):
         total = 0 + 10 + 20 + 50 + 100 + 200 + 500
         self.assertEqual(much_money.total, total)
 
+    def test_best_payment_overpays_least(self):
+        starting_cards = (2, 3, 1, 1, 0, 0, 0)
+        self.assertEqual(payment.best_payment(starting_cards, 60), (0, 1, 0, 1, 0, 0, 0))
+        self.assertEqual(payment.best_payment(starting_cards, 80), (0, 1, 1, 1, 0, 0, 0))
+        # 40 can't be paid exactly: a fifty beats 20 + 10 + 10 + 10 by using fewer cards
+        self.assertEqual(payment.best_payment((0, 3, 1, 1, 0, 0, 0), 45), (0, 0, 0, 1, 0, 0, 0))
+
+    def test_best_payment_when_wallet_holds_too_little(self):
+        self.assertIsNone(payment.best_payment((2, 3, 1, 1, 0, 0, 0), 110))
+
+    def test_valid_payments_reach_total_without_spare_cards(self):
+        options = list(payment.valid_payments((2, 3, 1, 1, 0, 0, 0), 30))
+        self.assertIn((0, 1, 1, 0, 0, 0, 0), options)
+        self.assertIn((0, 3, 0, 0, 0, 0, 0), options)
+        self.assertNotIn((0, 3, 1, 0, 0, 0, 0), options)
+        for option in options:
+            self.assertGreaterEqual(Payment(*option).total, 30)
+
 if __name__ == '__main__':
     unittest.main()
@@ -108,6 +108,25 @@ class TestPlayer(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.player.get_card_by_name('pheonix')
 
+    def test_get_card_by_name_removes_only_that_card(self):
+        cow, horse = self.deck[8], self.deck[9]
+        for c in (cow, cow, horse):
+            self.player.add_card(c)
+        self.player.get_card_by_name('cow')
+        self.assertEqual(self.player.cards, [cow, horse])
+        self.player.get_card_by_name('cow')
+        self.assertEqual(self.player.count_cards('cow'), 0)
+        with self.assertRaises(ValueError):
+            self.player.get_card_by_name('cow')
+        self.assertTrue(self.player.can_trade())
+
+    def test_count_cards(self):
+        self.player.add_card(self.deck[0])
+        self.player.add_card(self.deck[0])
+        self.assertEqual(self.player.count_cards(self.deck[0].name), 2)
+        self.assertEqual(self.player.count_cards('pheonix'), 0)
+        self.assertEqual(self.player.count_cards(['not', 'a', 'name']), 0)
+
     # test IO
 
     def test_buy_option_with_no_message(self):
@@ -141,6 +160,7 @@ class TestPlayer(unittest.TestCase):
         run_async(self.player.client.handle_msgs, False)
         action = run_async(self.player.choose_action, can_challenge=True, can_auction=True)
 
+        run_async(self.player.client.flush)
         msg = json.loads(self.sock.msg_queue.popleft())
         self.assertEqual(msg['type'], 'query')
         self.assertEqual(msg['payload'], 'Please choose auction or challenge')
@@ -195,6 +215,7 @@ class TestPlayer(unittest.TestCase):
         self.sock.push_to_queue([msg])
         run_async(self.player.client.handle_msgs, False)
         run_async(self.player.create_payment, 20)
+        run_async(self.player.client.flush)
         sent_msg = json.loads(self.sock.outbound_queue.popleft())
         self.assertEqual(
             sent_msg['type'], 'query'
@@ -216,20 +237,34 @@ class TestPlayer(unittest.TestCase):
             payment.count, expected_payment.count
         )
 
-    def test_get_bid_returns_amount_on_valid_bid(self):
-        msg = json.dumps({
-            'type': 'bid',
-            'payload': {'amount': 100}
-        })
+    def test_create_payment_query_suggests_payment(self):
+        msg = json.dumps({'type': 'payment', 'payload': {'tens': 1, 'fifties': 1}})
         self.sock.push_to_queue([msg])
         run_async(self.player.client.handle_msgs, False)
-        bid = self.player.get_bid()
-        self.assertEqual(
-            bid['amount'], 100
-        )
+        payment = run_async(self.player.create_payment, 60)
+        run_async(self.player.client.flush)
+        sent_msg = json.loads(self.sock.outbound_queue.popleft())
+        self.assertEqual(sent_msg['payload']['suggestion'], {'tens': 1, 'fifties': 1})
+        self.assertEqual(payment.total, 60)
+
+    def test_create_payment_with_auto_pay_skips_query(self):
+        self.player.auto_pay = True
+        payment = run_async(self.player.create_payment, 60)
+        self.assertEqual(payment.total, 60)
+        self.assertEqual(self.player.wallet.total, 40)
+        run_async(self.player.client.flush)
+        sent_msg = json.loads(self.sock.outbound_queue.popleft())
+        self.assertEqual(sent_msg['type'], 'message')
 
-    def test_get_bid_returns_none_on_invalid_bid(self):
-        self.assertIsNone(self.player.get_bid())
+    def test_wait_for_bid_skips_unaffordable_bids(self):
+        msgs = [
+            json.dumps({'type': 'bid', 'payload': {'amount': 1000}}),
+            json.dumps({'type': 'bid', 'payload': {'amount': 30}})
+        ]
+        self.sock.push_to_queue(msgs)
+        run_async(self.player.client.handle_msgs, False)
+        bid = run_async(self.player.wait_for_bid)
+        self.assertEqual(bid['amount'], 30)
 
     def test_get_challenge(self):
         msg = json.dumps({
@@ -239,6 +274,7 @@ class TestPlayer(unittest.TestCase):
         self.sock.push_to_queue([msg])
         run_async(self.player.client.handle_msgs, False)
         payload = run_async(self.player.get_challenge)
+        run_async(self.player.client.flush)
         sent_msg = json.loads(self.sock.outbound_queue.popleft())
         self.assertEqual(
             sent_msg['type'], 'query'
@@ -269,6 +305,7 @@ class TestPlayer(unittest.TestCase):
         self.sock.push_to_queue([msg])
         run_async(self.player.client.handle_msgs, False)
         run_async(self.player.get_name)
+        run_async(self.player.client.flush)
         sent_msg = json.loads(self.sock.outbound_queue.popleft())
         self.assertEqual(
             sent_msg['type'], 'query'
@@ -280,6 +317,7 @@ class TestPlayer(unittest.TestCase):
     def test_send_card(self):
         card = self.deck[25]
         run_async(self.player.send_card, card)
+        run_async(self.player.client.flush)
         sent_msg = json.loads(self.sock.outbound_queue.popleft())
         self.assertEqual(
             sent_msg['type'], 'card'
@@ -296,8 +334,99 @@ class TestPlayer(unittest.TestCase):
             'foo': 'spam'
         }
         run_async(self.player.update_state, global_state)
+        run_async(self.player.client.flush)
         returned_state = json.loads(self.sock.msg_queue.popleft())
         self.assertEqual(returned_state['type'], 'state')
         self.assertEqual(returned_state['payload']['global_state'], global_state)
         self.assertEqual(returned_state['payload']['my name'], self.player.name)
         self.assertEqual(returned_state['payload']['my wallet'], self.player.wallet.to_dict())
+
+    def test_update_state_with_version_sends_full_snapshot_first(self):
+        run_async(self.player.update_state, {'foo': 'spam'}, 1)
+        run_async(self.player.client.flush)
+        returned_state = json.loads(self.sock.msg_queue.popleft())
+        self.assertEqual(returned_state['payload']['version'], 1)
+        self.assertTrue(returned_state['payload']['full'])
+        self.assertEqual(returned_state['payload']['global_state'], {'foo': 'spam'})
+
+    def test_update_state_sends_delta_after_ack(self):
+        run_async(self.player.update_state, {'foo': 'spam', 'deck_count': 40}, 1)
+        self.sock.push_to_queue([json.dumps({'type': 'state-ack', 'payload': {'version': 1}})])
+        run_async(self.player.client.handle_msgs, False)
+        run_async(self.player.update_state, {'foo': 'spam', 'deck_count': 39}, 2)
+        run_async(self.player.client.flush)
+        self.sock.msg_queue.popleft()
+        returned_state = json.loads(self.sock.msg_queue.popleft())
+        self.assertEqual(returned_state['payload'], {
+            'version': 2,
+            'full': False,
+            'base': 1,
+            'global_state': {'deck_count': 39}
+        })
+
+    def test_update_state_sends_full_snapshot_after_resync(self):
+        run_async(self.player.update_state, {'foo': 'spam'}, 1)
+        self.sock.push_to_queue([
+            json.dumps({'type': 'state-ack', 'payload': {'version': 1}}),
+            json.dumps({'type': 'resync', 'payload': None})
+        ])
+        run_async(self.player.client.handle_msgs, False)
+        run_async(self.player.update_state, {'foo': 'spam'}, 2)
+        run_async(self.player.client.flush)
+        self.sock.msg_queue.popleft()
+        returned_state = json.loads(self.sock.msg_queue.popleft())
+        self.assertTrue(returned_state['payload']['full'])
+        self.assertEqual(returned_state['payload']['my wallet'], self.player.wallet.to_dict())
+
+    # test query deadlines
+
+    def test_choose_action_defaults_to_auction_after_deadline(self):
+        self.player.query_timeout = 0.01
+        action = run_async(self.player.choose_action, can_challenge=True, can_auction=True)
+        self.assertEqual(action, 'auction')
+        run_async(self.player.client.flush)
+        self.assertEqual(json.loads(self.sock.msg_queue[-1])['type'], 'message')
+
+    def test_late_answer_is_not_taken_for_next_query(self):
+        self.player.query_timeout = 0.01
+        run_async(self.player.choose_action, can_challenge=True, can_auction=True)
+        # the answer to the first query turns up after its deadline
+        self.sock.push_to_queue([json.dumps({'type': 'response', 'payload': 'challenge'})])
+        run_async(self.player.client.handle_msgs, False)
+        action = run_async(self.player.choose_action, can_challenge=True, can_auction=True)
+        self.assertEqual(action, 'auction')
+
+    def test_create_payment_defaults_to_suggestion_after_deadline(self):
+        self.player.query_timeout = 0.01
+        payment = run_async(self.player.create_payment, 60)
+        self.assertEqual(payment.total, 60)
+        self.assertEqual(self.player.wallet.total, 40)
+
+    def test_create_payment_deadline_covers_retries(self):
+        self.player.query_timeout = 0.05
+        self.sock.push_to_queue([json.dumps({'type': 'payment', 'payload': {'hundreds': 5}})])
+        run_async(self.player.client.handle_msgs, False)
+        payment = run_async(self.player.create_payment, 60)
+        self.assertEqual(payment.total, 60)
+
+    def test_challenge_payment_defaults_to_no_cards_after_deadline(self):
+        self.player.query_timeout = 0.01
+        payment = run_async(self.player.get_challenge_payment)
+        self.assertEqual(payment.count, 0)
+        self.assertEqual(self.player.wallet.total, 100)
+
+    def test_get_challenge_defaults_to_shared_animal_after_deadline(self):
+        opponent = Player(MockSocket(), str(uuid4()))
+        opponent.name = 'frodo'
+        cows = [c for c in self.deck if c.name == 'cow']
+        for player in (self.player, opponent):
+            player.add_card(cows.pop())
+        self.player.query_timeout = 0.01
+        payload = run_async(self.player.get_challenge, [opponent])
+        self.assertEqual(payload, {'player': 'frodo', 'card': 'cow'})
+
+    def test_get_name_defaults_after_deadline(self):
+        self.player.query_timeout = 0.01
+        run_async(self.player.get_name)
+        self.assertTrue(self.player.name.startswith('Player '))
+        self.assertIsNone(self.player.rejoin_id)
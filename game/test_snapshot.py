@@ -0,0 +1,114 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+from game import events, snapshot
+from game.async_test_helper import run_async
+from game.game import Game
+from game.local import LocalClient, SimpleAgent
+from game.player import Player
+
+
+async def start_local_game(turns, seed=3):
+    """Returns a game between SimpleAgents that has played the given number of turns"""
+
+    game = Game(num_players=3, auction_timeout=0, seed=seed)
+    for i, name in enumerate(['frodo', 'sam', 'pippin']):
+        player = Player(None, str(i), client=LocalClient(SimpleAgent(name, random.Random(i))))
+        await player.get_name()
+        game.add_player(player)
+    for _ in range(turns):
+        await game._play_turn()
+        game.players.rotate()
+    return game
+
+def wait_for_writes():
+    events.submit(lambda: None).result()
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'game.jsonl')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        game = run_async(start_local_game, 12)
+        restored = Game.from_snapshot(json.loads(json.dumps(game.to_snapshot())))
+        self.assertEqual(restored.to_snapshot(), game.to_snapshot())
+        self.assertEqual(restored.deck, game.deck)
+        for player, other in zip(game.players, restored.players):
+            self.assertEqual(other.uuid, player.uuid)
+            self.assertEqual(other.cards, player.cards)
+            self.assertEqual(other.wallet.total, player.wallet.total)
+        self.assertFalse(restored.is_ready)
+
+    def test_restored_wallet_continues_donkey_payouts(self):
+        game = run_async(start_local_game, 0)
+        # deal until the first donkey turns up
+        while game.deck.pop().name != 'donkey':
+            pass
+        for player in game.players:
+            player.wallet.donkey_played()
+        restored = Game.from_snapshot(game.to_snapshot())
+        wallet = restored.players[0].wallet
+        wallet.donkey_played()
+        self.assertEqual(wallet.hundreds, 1)
+
+    def test_later_snapshots_append_changes(self):
+        game = run_async(start_local_game, 0)
+        snapshotter = snapshot.Snapshotter(self.path)
+        snapshotter.snapshot(game)
+        run_async(game._play_turn)
+        game.players.rotate()
+        snapshotter.snapshot(game)
+        wait_for_writes()
+        with open(self.path) as f:
+            full, delta = [json.loads(line) for line in f]
+        self.assertNotIn('seed', delta)
+        self.assertIn('order', delta)
+        self.assertEqual(snapshot.load(self.path), game.to_snapshot())
+
+    def test_file_is_rewritten_after_full_every_deltas(self):
+        game = run_async(start_local_game, 0)
+        snapshotter = snapshot.Snapshotter(self.path, full_every=2)
+        # a full snapshot, two deltas, then a full snapshot and a delta
+        for _ in range(5):
+            snapshotter.snapshot(game)
+            game.players.rotate()
+        wait_for_writes()
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_change_a_delta_cant_express_is_saved_in_full(self):
+        snapshotter = snapshot.Snapshotter(self.path)
+        for state in [{'a': 1, 'b': 2}, {'a': 1, 'b': 2}, {'a': 1}]:
+            snapshotter.snapshot(SimpleNamespace(to_snapshot=lambda: dict(state)))
+        wait_for_writes()
+        with open(self.path) as f:
+            self.assertEqual([json.loads(line) for line in f], [{'a': 1}])
+
+    def test_load_ignores_half_written_line(self):
+        game = run_async(start_local_game, 0)
+        snapshotter = snapshot.Snapshotter(self.path)
+        snapshotter.snapshot(game)
+        wait_for_writes()
+        with open(self.path, 'a') as f:
+            f.write('{"order": [1, ')
+        self.assertEqual(snapshot.load(self.path), game.to_snapshot())
+
+    def test_remove(self):
+        game = run_async(start_local_game, 0)
+        snapshotter = snapshot.Snapshotter(self.path)
+        snapshotter.snapshot(game)
+        snapshotter.remove()
+        wait_for_writes()
+        self.assertFalse(os.path.exists(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
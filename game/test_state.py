@@ -0,0 +1,41 @@
+import unittest
+from game.state import diff_state, merge_state
+
+
+class TestState(unittest.TestCase):
+
+    def setUp(self):
+        self.old = {
+            'deck_count': 40,
+            'players': ['frodo', 'sam'],
+            'frodo': {'wallet': 7, 'cards': [], 'completed_sets': []},
+            'sam': {'wallet': 7, 'cards': [], 'completed_sets': []}
+        }
+
+    def test_diff_of_identical_states_is_empty(self):
+        self.assertEqual(diff_state(self.old, dict(self.old)), {})
+
+    def test_diff_only_contains_changed_fields(self):
+        new = merge_state(self.old, {})
+        new['deck_count'] = 39
+        new['sam'] = {'wallet': 7, 'cards': [('horse', 1000)], 'completed_sets': []}
+        self.assertEqual(
+            diff_state(self.old, new),
+            {'deck_count': 39, 'sam': {'cards': [('horse', 1000)]}}
+        )
+
+    def test_diff_returns_none_on_removed_key(self):
+        new = dict(self.old)
+        del new['sam']
+        self.assertIsNone(diff_state(self.old, new))
+
+    def test_merge_reverses_diff(self):
+        new = merge_state(self.old, {'frodo': {'wallet': 8}})
+        new['players'] = ['frodo', 'sam', 'pippin']
+        new['pippin'] = {'wallet': 7, 'cards': [], 'completed_sets': []}
+        self.assertEqual(merge_state(self.old, diff_state(self.old, new)), new)
+        # the original state is left untouched
+        self.assertEqual(self.old['frodo']['wallet'], 7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+from uuid import uuid4
+from game import tracing
+from game.game import Game
+from game.mock_socket import MockSocket
+from game.player import Player
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.tracer = tracing.Tracer(os.path.join(self.dir.name, 'game.json'))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_span_records_complete_event(self):
+        with self.tracer.span('auction', card='horse'):
+            pass
+        event = self.tracer.events[-1]
+        self.assertEqual(event['ph'], 'X')
+        self.assertEqual(event['name'], 'auction')
+        self.assertEqual(event['args'], {'card': 'horse'})
+        self.assertGreaterEqual(event['dur'], 0)
+
+    def test_async_span_records_begin_and_end(self):
+        with self.tracer.async_span('wait for bid', 2):
+            pass
+        begin, end = self.tracer.events[-2:]
+        self.assertEqual((begin['ph'], end['ph']), ('b', 'e'))
+        self.assertEqual(begin['id'], end['id'])
+        self.assertEqual(begin['tid'], 2)
+
+    def test_write(self):
+        with self.tracer.span('turn'):
+            pass
+        self.tracer.write()
+        with open(self.tracer.path) as f:
+            trace = json.load(f)
+        self.assertEqual(len(trace['traceEvents']), len(self.tracer.events))
+
+    def test_sample(self):
+        self.assertIs(tracing.sample(0), tracing.NULL_TRACER)
+        self.assertTrue(tracing.sample(1, self.dir.name).enabled)
+
+    def test_game_gives_clients_its_tracer(self):
+        game = Game(tracer=self.tracer)
+        player = Player(MockSocket(time_delay=0), uuid4())
+        game.add_player(player)
+        self.assertIs(player.client.tracer, self.tracer)
+        self.assertEqual(player.client.trace_row, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -76,5 +76,27 @@ class TestPayment(unittest.TestCase):
         self.assertFalse(self.wallet.check_payment(wrong_total))
         wrong_count = Payment(zeros=3)
 
+    def test_denomination_change_updates_cached_totals(self):
+        self.wallet.tens += 2
+        self.wallet.zeros = 0
+        self.assertEqual(self.wallet.to_dict()['tens'], 5)
+        self.assertEqual(self.wallet.count, 7)
+        self.assertEqual(self.wallet.total, 120)
+
+    def test_transfer_between_wallets(self):
+        other = Wallet()
+        other.accept_payment(self.wallet.create_payment({'tens': 2, 'fifties': 1}))
+        self.assertEqual((self.wallet.count, self.wallet.total), (4, 30))
+        self.assertEqual((other.count, other.total), (10, 170))
+        self.assertEqual(other.to_dict()['tens'], 5)
+
+    def test_suggest_payment(self):
+        self.assertEqual(self.wallet.suggest_payment(70), {'twenties': 1, 'fifties': 1})
+        self.assertIsNone(self.wallet.suggest_payment(500))
+
+    def test_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            self.wallet.__dict__
+
 if __name__ == '__main__':
     unittest.main()
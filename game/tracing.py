@@ -0,0 +1,93 @@
+import json
+import os
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from itertools import count
+from uuid import uuid4
+
+
+class Tracer:
+    """Records timed spans for one game and writes them as a Chrome trace-event file,
+    which can be opened in chrome://tracing or https://ui.perfetto.dev.
+    Game phases are drawn on one row, and each client's sends on a row of its own."""
+
+    enabled = True
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self.pid = os.getpid()
+        self._async_ids = count()
+        self.add_row(0, 'game')
+
+    def add_row(self, tid, name):
+        """Names the row that spans with this tid are drawn on"""
+
+        self.events.append({
+            'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+            'args': {'name': name}
+        })
+
+    @contextmanager
+    def span(self, name, tid=0, **args):
+        """Records the time spent inside the with block as a complete event"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.events.append({
+                'name': name, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                'ts': start * 1e6, 'dur': (time.perf_counter() - start) * 1e6,
+                'args': args
+            })
+
+    @contextmanager
+    def async_span(self, name, tid=0, **args):
+        """Records the with block as an async event, for waits that may overlap other spans on the row"""
+
+        span_id = next(self._async_ids)
+        event = {'name': name, 'cat': 'wait', 'id': span_id, 'pid': self.pid, 'tid': tid}
+        self.events.append({**event, 'ph': 'b', 'ts': time.perf_counter() * 1e6, 'args': args})
+        try:
+            yield
+        finally:
+            self.events.append({**event, 'ph': 'e', 'ts': time.perf_counter() * 1e6})
+
+    def write(self):
+        """Writes the recorded events to path"""
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+class NullTracer:
+    """Tracer for games that aren't sampled; every span is a shared no-op"""
+
+    enabled = False
+    _span = nullcontext()
+
+    def add_row(self, tid, name):
+        pass
+
+    def span(self, name, tid=0, **args):
+        return self._span
+
+    def async_span(self, name, tid=0, **args):
+        return self._span
+
+    def write(self):
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+def sample(rate, trace_dir='traces'):
+    """Returns a Tracer writing to a new file in trace_dir for a fraction rate of calls,
+    and NULL_TRACER otherwise"""
+
+    if rate and random.random() < rate:
+        return Tracer(os.path.join(trace_dir, f'game-{uuid4().hex}.json'))
+    return NULL_TRACER
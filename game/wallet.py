@@ -1,103 +1,66 @@
-from .payment import Payment
-
-class Wallet:
-    """object to track money, and send and receive Payment objects"""
-
-    def __init__(self):
-        self.zeros = 2        
-        self.tens = 3
-        self.twenties = 1
-        self.fifties = 1
-        self.hundreds = 0
-        self.twohundreds = 0
-        self.fivehundreds = 0
-        self._donkey_count = 0
-
-    @property
-    def total(self):
-        
-        return (
-            self.tens * 10 + \
-            self.twenties * 20 + \
-            self.fifties * 50 + \
-            self.hundreds * 100 + \
-            self.twohundreds * 200 + \
-            self.fivehundreds * 500
-        )
-
-    @property
-    def count(self):
-
-        return sum(
-            [self.zeros, self.tens, self.twenties, self.fifties,
-            self.hundreds, self.twohundreds, self.fivehundreds]
-        )
+from .payment import DENOMINATIONS, VALUES, MoneyCards, Payment, best_payment
+
+# denomination index of the extra money card paid out by each donkey, in order
+DONKEY_PAYOUTS = (
+    DENOMINATIONS.index('fifties'),
+    DENOMINATIONS.index('hundreds'),
+    DENOMINATIONS.index('twohundreds'),
+    DENOMINATIONS.index('fivehundreds')
+)
+
+# two zeros, three tens, a twenty and a fifty
+STARTING_CARDS = (2, 3, 1, 1, 0, 0, 0)
+
+class Wallet(MoneyCards):
+    """object to track money, and send and receive Payment objects.
+    cards and donkey_count restore a wallet part way through a game"""
+
+    __slots__ = ('_donkey_count',)
+
+    def __init__(self, cards=STARTING_CARDS, donkey_count=0):
+        super().__init__(cards)
+        self._donkey_count = donkey_count
 
     def donkey_played(self):
         """Call each time a donkey card appears to add extra money card"""
-        
-        if self._donkey_count == 0:
-            self.fifties += 1
-        elif self._donkey_count == 1:
-            self.hundreds += 1
-        elif self._donkey_count == 2:
-            self.twohundreds += 1
-        elif self._donkey_count == 3:
-            self.fivehundreds += 1
-        else:
+
+        if self._donkey_count >= len(DONKEY_PAYOUTS):
             raise Exception('Donkey played too many times')
+        index = DONKEY_PAYOUTS[self._donkey_count]
+        self.cards[index] += 1
+        self._total += VALUES[index]
+        self._count += 1
         self._donkey_count += 1
 
     def create_payment(self, money_dict):
         """Moves money cards specified in money_dict into a Payment object and returns it. Raises ValueError when trying to spend more money than wallet contains."""
-        
+
         payment = Payment(**money_dict)
         if not self.check_payment(payment):
             raise ValueError('Not enough money cards in wallet for this transaction.')
-        self.zeros -= payment.zeros
-        self.tens -= payment.tens
-        self.twenties -= payment.twenties
-        self.fifties -= payment.fifties
-        self.hundreds -= payment.hundreds
-        self.twohundreds -= payment.twohundreds
-        self.fivehundreds -= payment.fivehundreds
+        self._subtract(payment)
         return payment
-        
+
     def accept_payment(self, payment):
         """Moves money from payment object into wallet"""
-        
-        self.zeros += payment.zeros
-        self.tens += payment.tens
-        self.twenties += payment.twenties
-        self.fifties += payment.fifties
-        self.hundreds += payment.hundreds
-        self.twohundreds += payment.twohundreds
-        self.fivehundreds += payment.fivehundreds
+
+        self._add(payment)
 
     def check_payment(self, payment):
         """Checks that payment request is available in this wallet and returns bool"""
-        
-        if self.total < payment.total \
-            or self.count < payment.count \
-            or self.zeros < payment.zeros \
-            or self.tens < payment.tens \
-            or self.twenties < payment.twenties \
-            or self.fifties < payment.fifties \
-            or self.hundreds < payment.hundreds \
-            or self.twohundreds < payment.twohundreds \
-            or self.fivehundreds < payment.fivehundreds:
-            return False
-        return True
+
+        return self.covers(payment)
+
+    def suggest_payment(self, total):
+        """Returns the payment worth at least total that overpays least, as a dict for
+        create_payment, or None if the wallet holds less than total"""
+
+        payment = best_payment(tuple(self.cards), total)
+        if payment is None:
+            return None
+        return {name: n for name, n in zip(DENOMINATIONS, payment) if n}
 
     def to_dict(self):
         """Returns contents of wallet as dict"""
 
-        return {
-            'zeros': self.zeros,
-            'tens': self.tens,
-            'twenties': self.twenties,
-            'fifties': self.fifties,
-            'hundreds': self.hundreds,
-            'twohundreds': self.twohundreds,
-            'fivehundreds': self.fivehundreds
-        }
+        return dict(zip(DENOMINATIONS, self.cards))
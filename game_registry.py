@@ -0,0 +1,253 @@
+import asyncio
+import os
+from functools import partial
+from uuid import uuid4
+from game import metrics, snapshot, tracing
+from game.bot import BotAgent, create_bot
+from game.client import SEND_QUEUE_SIZE
+from game.events import EventLog
+from game.game import Game
+from game.local import LocalClient
+from game_supervisor import GameSupervisor
+
+# seconds a restored game keeps its players' seats for them when the registry has neither a
+# reclaim_time nor a bot_wait
+RESTORED_SEAT_TIME = 120
+
+
+class GameRegistry:
+    """Tracks the games running on a server and matches joining clients to games with open seats.
+    param num_players: number of players per game
+    param auction_timeout: passed to each Game created by the registry
+    param trace_rate: fraction of games traced, see game.tracing
+    param trace_dir: directory the trace files are written to
+    param log_dir: directory an event log per game is written to, see game.events; None for no logs
+    param snapshot_dir: directory each running game is saved to at every turn, see game.snapshot;
+    None for no snapshots
+    param auto_pay: players pay for auctions they win with the suggested payment, see Player.create_payment
+    param send_queue_size: most messages waiting to be written to each client, see game.client.Client
+    param full_queue_policy: what happens when a client's send queue is full, see game.client.Client
+    param query_timeout: seconds players have to answer each query, see Player.query_timeout
+    param bot_wait: seconds a game waits for players before its open seats are filled with bots,
+    see game.bot; None for games that only start with enough people
+    param reclaim_time: seconds a bot plays for a disconnected player, keeping their seat for them
+    to reclaim by rejoining, before the seat is the bot's for good; None to end a game whenever a
+    player disconnects
+    param resume_time: seconds a client whose connection drops has to resume its session, see
+    game.client.Client.resume; 0 to treat every dropped connection as a disconnect
+    """
+
+    def __init__(self, num_players=3, auction_timeout=15, trace_rate=0, trace_dir='traces',
+            log_dir=None, snapshot_dir=None, auto_pay=False, send_queue_size=SEND_QUEUE_SIZE,
+            full_queue_policy='coalesce', query_timeout=None, bot_wait=None,
+            reclaim_time=None, resume_time=0):
+        self.num_players = num_players
+        self.auction_timeout = auction_timeout
+        self.trace_rate = trace_rate
+        self.trace_dir = trace_dir
+        self.log_dir = log_dir
+        self.snapshot_dir = snapshot_dir
+        self.auto_pay = auto_pay
+        self.send_queue_size = send_queue_size
+        self.full_queue_policy = full_queue_policy
+        self.query_timeout = query_timeout
+        self.bot_wait = bot_wait
+        self.reclaim_time = reclaim_time
+        self.resume_time = resume_time
+        # supervisors indexed by game; dicts keep insertion order, so the
+        # oldest game with open seats is always filled first
+        self.open_games = {}
+        self.running_games = {}
+        self.num_clients = 0
+        # seats waiting for their player to rejoin, by player id: every seat of a restored game,
+        # and seats a bot is keeping for a disconnected player
+        self.vacant_seats = {}
+        # (game, player) of every seat of a running game held by a client, by resume token
+        self.sessions = {}
+
+    @property
+    def num_games(self):
+        """Returns the number of games either waiting for players or in progress"""
+
+        return len(self.open_games) + len(self.running_games)
+
+    def get_game(self):
+        """Reserves a seat and returns the game it belongs to, creating a new game when none have open seats"""
+
+        if self.open_games:
+            supervisor = next(iter(self.open_games.values()))
+        else:
+            supervisor = self._create_game()
+        supervisor.reserve_spot()
+        if not supervisor.needs_players:
+            del self.open_games[supervisor.game]
+            self.running_games[supervisor.game] = supervisor
+        return supervisor.game
+
+    def _create_game(self):
+        """Creates a game, starts it running and indexes it as open"""
+
+        game = Game(
+            num_players=self.num_players,
+            auction_timeout=self.auction_timeout,
+            tracer=tracing.sample(self.trace_rate, self.trace_dir),
+            event_log=self._create_event_log(),
+            snapshotter=self._create_snapshotter()
+        )
+        supervisor = GameSupervisor(game)
+        self.open_games[game] = supervisor
+        metrics.games_created.inc()
+        self._start_game(game)
+        if self.bot_wait is not None:
+            asyncio.get_running_loop().call_later(self.bot_wait, self._fill_with_bots, supervisor)
+        return supervisor
+
+    def _fill_with_bots(self, supervisor):
+        """Seats bots in the open places of a game still waiting for players, which starts it"""
+
+        game = supervisor.game
+        if game not in self.open_games:
+            return
+        names = {p.name for p in game.players}
+        number = 1
+        while supervisor.needs_players:
+            while f'Bot {number}' in names:
+                number += 1
+            supervisor.reserve_spot()
+            game.add_player(create_bot(f'Bot {number}'))
+            names.add(f'Bot {number}')
+            metrics.bots_seated.inc()
+        del self.open_games[game]
+        self.running_games[game] = supervisor
+
+    def _start_game(self, game):
+        """Starts game running, to be dropped from the indexes when it ends"""
+
+        if self.reclaim_time is not None:
+            game.stand_in = partial(self._stand_in, game)
+        task = asyncio.create_task(game.run())
+        task.add_done_callback(lambda _: self._remove_game(game))
+
+    def _create_event_log(self):
+        """Returns an EventLog for a new game, or None when games aren't logged"""
+
+        if self.log_dir is None:
+            return None
+        return EventLog(os.path.join(self.log_dir, f'game-{uuid4().hex}.jsonl'))
+
+    def _create_snapshotter(self, path=None):
+        """Returns a Snapshotter for a new game, or None when games aren't saved"""
+
+        if self.snapshot_dir is None:
+            return None
+        return snapshot.Snapshotter(
+            path or os.path.join(self.snapshot_dir, f'game-{uuid4().hex}.jsonl'))
+
+    def restore(self):
+        """Reloads the games saved in snapshot_dir by an earlier server process. Each game
+        starts again from the turn it was on once all of its players have rejoined. Seats not
+        taken back within reclaim_time seconds, or bot_wait when there is no reclaim_time, go
+        to bots."""
+
+        if self.snapshot_dir is None or not os.path.isdir(self.snapshot_dir):
+            return
+        seat_time = next(
+            (t for t in (self.reclaim_time, self.bot_wait) if t is not None), RESTORED_SEAT_TIME)
+        loop = asyncio.get_running_loop()
+        for name in sorted(os.listdir(self.snapshot_dir)):
+            if not name.endswith('.jsonl'):
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            state = snapshot.load(path)
+            if state is None:
+                continue
+            game = Game.from_snapshot(state)
+            game.snapshots = self._create_snapshotter(path)
+            supervisor = GameSupervisor(game)
+            supervisor.open_places = 0
+            self.running_games[game] = supervisor
+            for player in game.players:
+                if player.is_bot:
+                    player.replace_client(LocalClient(BotAgent(player.name)))
+                else:
+                    seat = self.vacant_seats[player.uuid] = (game, player)
+                    loop.call_later(seat_time, self._give_seat_to_bot, seat)
+            if all(p.is_bot for p in game.players):
+                game.ready.set()
+            self._start_game(game)
+
+    def _stand_in(self, game, player):
+        """Returns a bot client to play for a disconnected player, keeping the seat for them for
+        reclaim_time seconds"""
+
+        metrics.stand_ins.inc()
+        seat = self.vacant_seats[player.uuid] = (game, player)
+        asyncio.get_running_loop().call_later(self.reclaim_time, self._give_seat_to_bot, seat)
+        return LocalClient(BotAgent(player.name))
+
+    def _give_seat_to_bot(self, seat):
+        """Stops keeping a seat for a disconnected player who hasn't come back. Does nothing if
+        they have come back since, even if they have disconnected again."""
+
+        game, player = seat
+        if self.vacant_seats.get(player.uuid) is seat:
+            del self.vacant_seats[player.uuid]
+            player.is_bot = True
+            if not game.is_ready:
+                # a restored game still waiting for its players
+                player.replace_client(LocalClient(BotAgent(player.name)))
+                if not any(p.uuid in self.vacant_seats for p in game.players):
+                    game.ready.set()
+
+    def rejoin(self, player):
+        """Gives player's client back the seat it held in a restored game, or that a bot is keeping
+        for it, if player asked for one with a player id, and returns the game. Returns None when
+        there is no such seat."""
+
+        seat = self.vacant_seats.pop(player.rejoin_id, None)
+        if seat is None:
+            return None
+        game, restored_player = seat
+        restored_player.replace_client(player.client)
+        restored_player.auto_pay = player.auto_pay
+        restored_player.query_timeout = player.query_timeout
+        if len(game.players) == game.num_players and not any(
+                p.uuid in self.vacant_seats for p in game.players):
+            game.ready.set()
+        return game
+
+    def keep_session(self, game, player):
+        """Lets player's client resume its session with player.resume_token while game runs"""
+
+        self.sessions[player.resume_token] = (game, player)
+
+    def resume(self, player, websocket):
+        """Moves the seat whose resume token player sent with its name onto player's connection,
+        websocket, replaying the messages the seat's client missed. Returns (game, seat, complete),
+        where complete is False if some missed messages were too old to replay, in which case the
+        seat's next state update is a full snapshot. Returns None when there is no such seat, or
+        its client can't resume."""
+
+        if player.resume_request is None:
+            return None
+        token, received = player.resume_request
+        session = self.sessions.get(token)
+        if session is None:
+            return None
+        game, seat = session
+        complete = seat.client.resume(websocket, received)
+        if complete is None:
+            return None
+        if not complete:
+            seat.reset_state_acks()
+        return game, seat, complete
+
+    def _remove_game(self, game):
+        """Drops a finished game from the indexes. Called when the game's run task is done."""
+
+        self.open_games.pop(game, None)
+        self.running_games.pop(game, None)
+        for player in game.players:
+            self.vacant_seats.pop(player.uuid, None)
+            self.sessions.pop(player.resume_token, None)
+        metrics.games_completed.inc()
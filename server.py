@@ -1,24 +1,92 @@
+import argparse
 import asyncio
 import json
+import multiprocessing
+import os
 import websockets
+from multiprocessing.connection import wait
 from uuid import uuid4
-from game.game import Game
+from game import codec, metrics
+from game.client import FULL_QUEUE_POLICIES, SEND_QUEUE_SIZE, Client
 from game.player import Player
-from game_supervisor import GameSupervisor
+from game_registry import GameRegistry
 
 
-current_games = []
-num_clients = 0
-called_get_game = 0
+registry = GameRegistry(auction_timeout=0.001)
 
-def main():
-    """Creates and destroys the event loop and server"""
+# seconds players have to answer each query, by default
+QUERY_TIMEOUT = 60
 
-    start_server = websockets.serve(lobby, 'localhost', 9876)
+# seconds a bot keeps a disconnected player's seat for them, by default
+RECLAIM_TIME = 120
+
+# seconds a client whose connection drops has to resume its session, by default
+RESUME_TIME = 15
+
+# seconds to keep writing a finished game's last messages to a client before closing its connection
+FLUSH_TIMEOUT = 5
+
+def main(num_workers=1, host='localhost', port=9876, metrics_port=9877, trace_rate=0, trace_dir='traces',
+        log_dir=None, snapshot_dir=None, auto_pay=False, send_queue_size=SEND_QUEUE_SIZE,
+        full_queue_policy='coalesce', query_timeout=QUERY_TIMEOUT, bot_wait=None,
+        reclaim_time=RECLAIM_TIME, resume_time=RESUME_TIME):
+    """Runs the server in this process, or when num_workers is more than 1 runs num_workers
+    server processes sharing the listening port and reports their combined load"""
+
+    options = dict(trace_rate=trace_rate, trace_dir=trace_dir, log_dir=log_dir, auto_pay=auto_pay,
+        send_queue_size=send_queue_size, full_queue_policy=full_queue_policy,
+        query_timeout=query_timeout, bot_wait=bot_wait, reclaim_time=reclaim_time,
+        resume_time=resume_time)
+    if num_workers > 1:
+        run_workers(num_workers, host, port, metrics_port, snapshot_dir, **options)
+    else:
+        run_server(host, port, metrics_port=metrics_port, snapshot_dir=snapshot_dir, **options)
+
+def run_server(host, port, reuse_port=False, status_conn=None, metrics_port=None,
+        trace_rate=0, trace_dir='traces', log_dir=None, snapshot_dir=None, auto_pay=False,
+        send_queue_size=SEND_QUEUE_SIZE, full_queue_policy='coalesce', query_timeout=QUERY_TIMEOUT, bot_wait=None,
+        reclaim_time=RECLAIM_TIME, resume_time=RESUME_TIME):
+    """Creates and destroys the event loop and server.
+    param reuse_port: bind with SO_REUSEPORT so several processes can share the port
+    param status_conn: multiprocessing Connection that client and game counts are reported to
+    param metrics_port: local port serving metrics in Prometheus text format, if given
+    param trace_rate: fraction of games traced to Chrome trace files in trace_dir
+    param log_dir: directory every game's event log is written to, if given
+    param snapshot_dir: directory running games are saved to each turn, and restored from on start
+    param auto_pay: pay for won auctions with the suggested payment instead of asking the player
+    param send_queue_size: most messages waiting to be written to a client, see game.client.Client
+    param full_queue_policy: what to do when a client's send queue is full, one of FULL_QUEUE_POLICIES
+    param query_timeout: seconds players have to answer each query before a default answer is
+    chosen for them, or 0 for no limit
+    param bot_wait: seconds a game waits for players before bots take its open seats, if given
+    param reclaim_time: seconds a bot playing for a disconnected player keeps their seat for them,
+    or None to end the game when a player disconnects
+    param resume_time: seconds a client whose connection drops has to resume its session and get
+    the messages it missed, or 0 to treat every dropped connection as a disconnect"""
+
+    registry.trace_rate = trace_rate
+    registry.trace_dir = trace_dir
+    registry.log_dir = log_dir
+    registry.snapshot_dir = snapshot_dir
+    registry.auto_pay = auto_pay
+    registry.send_queue_size = send_queue_size
+    registry.full_queue_policy = full_queue_policy
+    registry.query_timeout = query_timeout or None
+    registry.bot_wait = bot_wait
+    registry.reclaim_time = reclaim_time
+    registry.resume_time = resume_time
+    start_server = websockets.serve(
+        lobby, host, port, reuse_port=reuse_port, subprotocols=[codec.SUBPROTOCOL])
     loop = asyncio.get_event_loop()
+    # restored games start running straight away, so need the loop running
+    loop.call_soon(registry.restore)
     loop.run_until_complete(start_server)
-    print('started server at port 9876')
-    loop.create_task(cleanup_games())
+    print(f'started server at port {port} (pid {os.getpid()})')
+    if metrics_port:
+        loop.run_until_complete(metrics.serve(port=metrics_port))
+        print(f'serving metrics at http://127.0.0.1:{metrics_port}/metrics')
+    if status_conn:
+        loop.create_task(report_status(status_conn))
     try:
         loop.run_forever()
     except Exception as e:
@@ -33,56 +101,157 @@ def main():
     loop.close()
     print('Server stopped')
 
-def get_game():
-    """Returns a game with open spots"""
-    global called_get_game
-    called_get_game += 1
-
-    if not len(current_games) or not current_games[-1].needs_players:
-        game = Game(auction_timeout=0.001)
-        supervisor = GameSupervisor(game)
-        supervisor.reserve_spot()
-        current_games.append(supervisor)
-        loop = asyncio.get_running_loop()
-        asyncio.create_task(game.run())
-        return game
-    else:
-        #TODO: autocancel a game if a client disconnects
-        supervisor = current_games[-1]
-        supervisor.reserve_spot()
-        return supervisor.game
+def run_workers(num_workers, host, port, metrics_port=None, snapshot_dir=None, **options):
+    """Starts num_workers server processes on the same port, each with its own GameRegistry,
+    and prints their combined client and game counts whenever they change.
+    Each worker serves its metrics on its own port, counting up from metrics_port, and saves
+    its games to its own subdirectory of snapshot_dir. The other options are passed to each
+    worker's run_server as keyword arguments."""
 
-async def lobby(websocket, path):
-    """Entry point for a client to join game"""
-    
-    global num_clients
-    num_clients += 1
-
-    game = get_game()
-    player = Player(websocket, str(uuid4()))
-    sock_handler = asyncio.create_task(player.client.handle_msgs(game.is_complete))
-    await player.get_name()
-    game.add_player(player)
-    await player.client.send_msg(
-        'You\'ve been successfully added to the game! The game will start when enough players join',
-        'message'
-    )
-    
-    # when the game is marked complete the player websocket is closed
-    while not game.is_complete:
-        await asyncio.sleep(0.001)
-    num_clients -=1
+    conns = {}
+    workers = []
+    for i in range(num_workers):
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        worker_metrics_port = metrics_port + i if metrics_port else None
+        worker_snapshot_dir = os.path.join(snapshot_dir, f'worker-{i}') if snapshot_dir else None
+        worker = multiprocessing.Process(
+            target=run_server,
+            kwargs=dict(options, host=host, port=port, reuse_port=True, status_conn=child_conn,
+                metrics_port=worker_metrics_port, snapshot_dir=worker_snapshot_dir),
+            daemon=True
+        )
+        worker.start()
+        child_conn.close()
+        conns[parent_conn] = worker
+        workers.append(worker)
+
+    status = {}
+    last_totals = None
+    try:
+        while conns:
+            for conn in wait(list(conns)):
+                try:
+                    pid, num_clients, num_games = conn.recv()
+                except EOFError:
+                    # worker exited
+                    status.pop(conns.pop(conn).pid, None)
+                    continue
+                status[pid] = (num_clients, num_games)
+            totals = tuple(sum(counts) for counts in zip(*status.values())) or (0, 0)
+            if totals != last_totals:
+                print(f'Workers: {len(status)} Clients: {totals[0]} Games: {totals[1]}')
+                last_totals = totals
+    except KeyboardInterrupt:
+        print('shutting down workers')
+    for worker in workers:
+        worker.join()
 
-async def cleanup_games():
-    """Check currently running games for completed games and remove them"""
+async def report_status(conn, interval=5):
+    """Sends this process's client and game counts to the parent every interval seconds"""
 
     while True:
-        for supervisor in current_games:
-            if supervisor.game.is_complete:
-                current_games.remove(supervisor)
-        print(f'Clients: {num_clients} Games: {len(current_games)} Called Get Game: {called_get_game}')
-        await asyncio.sleep(0.001)
+        conn.send((os.getpid(), registry.num_clients, registry.num_games))
+        await asyncio.sleep(interval)
+
+async def lobby(websocket, path):
+    """Entry point for a client to join game"""
+    
+    registry.num_clients += 1
+    try:
+        client = Client(websocket, registry.send_queue_size, registry.full_queue_policy,
+            registry.resume_time)
+        player = Player(websocket, str(uuid4()), client=client)
+        player.auto_pay = registry.auto_pay
+        player.query_timeout = registry.query_timeout
+        sock_handler = asyncio.create_task(player.client.handle_msgs(False))
+        await player.get_name()
+        resumed = registry.resume(player, websocket)
+        if resumed:
+            # the seat's client carries on over this connection, after replaying what it missed
+            game, seat, complete = resumed
+            sock_handler.cancel()
+            client.move_msgs_to(seat.client)
+            client = seat.client
+            sock_handler = asyncio.create_task(client.handle_msgs(False))
+            if not complete and game.global_state is not None:
+                await seat.update_state(game.global_state, game.state_version)
+        else:
+            game = registry.rejoin(player)
+            if game and game.is_ready:
+                await player.client.send_msg('You\'ve rejoined your game!', 'message')
+                seat = next(p for p in game.players if p.client is client)
+                if game.global_state is not None:
+                    await seat.update_state(game.global_state, game.state_version)
+            elif game:
+                await player.client.send_msg(
+                    'You\'ve rejoined your game! It will carry on when every player is back',
+                    'message'
+                )
+                seat = next(p for p in game.players if p.client is client)
+            else:
+                game = registry.get_game()
+                game.add_player(player)
+                await player.client.send_msg(
+                    'You\'ve been successfully added to the game! The game will start when enough players join',
+                    'message'
+                )
+                seat = player
+            registry.keep_session(game, seat)
+            # the player id is sent back with the username after a server restart to take back
+            # this seat, and the resume token after the connection drops to carry on without a gap
+            await client.send_msg(
+                {'player_id': seat.uuid, 'resume_token': seat.resume_token}, 'player-id')
+        
+        # when the game is marked complete, or the client leaves and a bot takes their seat,
+        # the player websocket is closed once the last messages have been written
+        completed = asyncio.create_task(game.completed.wait())
+        await asyncio.wait([completed, sock_handler], return_when=asyncio.FIRST_COMPLETED)
+        completed.cancel()
+        await client.flush(FLUSH_TIMEOUT)
+    finally:
+        registry.num_clients -= 1
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Run the Kuhhandel game server')
+    parser.add_argument('--workers', type=int, default=1,
+        help='number of server processes sharing the port, e.g. one per CPU core')
+    parser.add_argument('--port', type=int, default=9876)
+    parser.add_argument('--metrics-port', type=int, default=9877,
+        help='local port serving metrics in Prometheus text format, 0 to disable')
+    parser.add_argument('--trace-rate', type=float, default=0,
+        help='fraction of games to trace, e.g. 0.01 for one game in a hundred')
+    parser.add_argument('--trace-dir', default='traces',
+        help='directory that trace files (Chrome trace-event JSON) are written to')
+    parser.add_argument('--log-dir', default=None,
+        help='directory to write an event log per game to, for replaying games with game.replay')
+    parser.add_argument('--snapshot-dir', default=None,
+        help='directory to save running games to every turn, so they can resume after a restart')
+    parser.add_argument('--auto-pay', action='store_true',
+        help='pay for won auctions with the payment that overpays least, without asking the player')
+    parser.add_argument('--send-queue-size', type=int, default=SEND_QUEUE_SIZE,
+        help='most messages waiting to be written to one client before --full-queue-policy applies')
+    parser.add_argument('--full-queue-policy', choices=FULL_QUEUE_POLICIES, default='coalesce',
+        help='when a client falls behind: drop its stale state messages (disconnecting it if that '
+            'is not enough), or disconnect it')
+    parser.add_argument('--query-timeout', type=float, default=QUERY_TIMEOUT,
+        help='seconds players have to answer each query before the server answers for them, '
+            'e.g. by auctioning or paying the least it can; 0 for no limit')
+    parser.add_argument('--bot-wait', type=float, default=None,
+        help='seconds a game waits for players before bots fill its open seats; '
+            'by default games wait for enough people')
+    parser.add_argument('--reclaim-time', type=float, default=RECLAIM_TIME,
+        help='seconds a bot playing for a disconnected player keeps their seat, for them to take '
+            'back by reconnecting')
+    parser.add_argument('--resume-time', type=float, default=RESUME_TIME,
+        help='seconds a client whose connection drops has to reconnect and carry on where it left '
+            'off, before it counts as disconnected; 0 to disable')
+    parser.add_argument('--end-games-on-disconnect', action='store_true',
+        help='end a game when a player disconnects, instead of having a bot play on for them')
+    args = parser.parse_args()
+    main(args.workers, port=args.port, metrics_port=args.metrics_port,
+        trace_rate=args.trace_rate, trace_dir=args.trace_dir, log_dir=args.log_dir,
+        snapshot_dir=args.snapshot_dir, auto_pay=args.auto_pay, send_queue_size=args.send_queue_size,
+        full_queue_policy=args.full_queue_policy, query_timeout=args.query_timeout,
+        bot_wait=args.bot_wait, reclaim_time=None if args.end_games_on_disconnect else args.reclaim_time,
+        resume_time=args.resume_time)
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import websockets
+from uuid import uuid4
+from test_concurrency_client import respond
+
+# the binary wire format is shared with the server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from game import codec
+
+# types of the server message that answers each kind of response, so a response is timed until
+# its own reply and not until other players' bids or state that happen to arrive first.
+# State acks get no reply, so they aren't timed.
+REPLY_TYPES = {
+    'username': ('message',),
+    'response': ('card',),
+    # the payment query for a valid challenge, else an error
+    'challenge': ('query', 'error'),
+    # the challenge being announced, else the payment query again
+    'payment': ('message', 'query'),
+}
+
+
+class LoadStats:
+    """Collects the measurements made by the load test clients"""
+
+    def __init__(self):
+        self.latencies = []
+        self.msgs_received = 0
+        self.msgs_sent = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.connection_errors = 0
+        self.games_completed = 0
+
+    def report(self, elapsed, target_games):
+        """Returns the collected measurements as a dict ready to be written as JSON"""
+
+        return {
+            'target_games': target_games,
+            'elapsed_seconds': round(elapsed, 3),
+            'games_completed': self.games_completed,
+            'messages_received': self.msgs_received,
+            'messages_sent': self.msgs_sent,
+            'messages_per_second': round((self.msgs_received + self.msgs_sent) / elapsed, 1),
+            'bytes_received': self.bytes_received,
+            'bytes_sent': self.bytes_sent,
+            'connection_errors': self.connection_errors,
+            'latency_ms': latency_percentiles(self.latencies),
+        }
+
+def latency_percentiles(latencies):
+    """Returns p50, p95, p99 and max of a list of latencies in seconds, in milliseconds"""
+
+    if len(latencies) < 2:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        'p50': round(cuts[49] * 1000, 3),
+        'p95': round(cuts[94] * 1000, 3),
+        'p99': round(cuts[98] * 1000, 3),
+        'max': round(max(latencies) * 1000, 3),
+    }
+
+async def client(uri, user_id, stats, binary=False):
+    """Plays one game as user_id, timing each response until the server's reply to it, see
+    REPLY_TYPES. With binary the connection asks for the binary wire format, see game.codec."""
+
+    opponent_list = []
+    # (reply types, send time) of the response waiting for its reply
+    awaiting = None
+    subprotocols = [codec.SUBPROTOCOL] if binary else None
+    try:
+        async with websockets.connect(uri, subprotocols=subprotocols) as websocket:
+            async for msg in websocket:
+                received_at = time.perf_counter()
+                stats.msgs_received += 1
+                stats.bytes_received += len(msg)
+                msg_dict = codec.decode(msg) if isinstance(msg, bytes) else json.loads(msg)
+                msg_type = msg_dict['type']
+                if awaiting is not None and msg_type in awaiting[0]:
+                    stats.latencies.append(received_at - awaiting[1])
+                    awaiting = None
+                if msg_type == 'game-over':
+                    return True
+                response = respond(msg_dict, user_id, opponent_list)
+                if response:
+                    reply_types = REPLY_TYPES.get(response['type'])
+                    if binary:
+                        response = codec.encode(response['type'], response['payload'])
+                    else:
+                        response = json.dumps(response)
+                    await websocket.send(response)
+                    stats.msgs_sent += 1
+                    stats.bytes_sent += len(response)
+                    if reply_types:
+                        awaiting = reply_types, time.perf_counter()
+    except (OSError, websockets.exceptions.WebSocketException):
+        stats.connection_errors += 1
+    return False
+
+async def game_slot(uri, stats, start_delay, end_time, binary=False):
+    """Keeps one game's worth of clients playing back to back until end_time"""
+
+    await asyncio.sleep(start_delay)
+    while time.perf_counter() < end_time:
+        results = await asyncio.gather(*(client(uri, str(uuid4()), stats, binary) for _ in range(3)))
+        if all(results):
+            stats.games_completed += 1
+
+async def run_load_test(uri, target_games, ramp_seconds, duration, binary=False):
+    """Ramps up to target_games concurrent games over ramp_seconds, keeps them running until
+    duration seconds have passed, and returns the report. With binary the clients use the
+    binary wire format instead of JSON."""
+
+    stats = LoadStats()
+    start = time.perf_counter()
+    end_time = start + duration
+    await asyncio.gather(*(
+        game_slot(uri, stats, i * ramp_seconds / target_games, end_time, binary)
+        for i in range(target_games)
+    ))
+    return stats.report(time.perf_counter() - start, target_games)
+
+def compare(report, baseline, tolerance):
+    """Returns a list of regressions in report relative to baseline, allowing tolerance
+    (a fraction) of slack on throughput and p95 latency"""
+
+    regressions = []
+    if report['messages_per_second'] < baseline['messages_per_second'] * (1 - tolerance):
+        regressions.append(
+            f"messages per second fell from {baseline['messages_per_second']} to {report['messages_per_second']}")
+    new_p95 = report['latency_ms']['p95']
+    old_p95 = baseline['latency_ms']['p95']
+    if new_p95 is not None and old_p95 is not None and new_p95 > old_p95 * (1 + tolerance):
+        regressions.append(f'p95 latency rose from {old_p95} ms to {new_p95} ms')
+    if report['connection_errors'] > baseline['connection_errors']:
+        regressions.append(
+            f"connection errors rose from {baseline['connection_errors']} to {report['connection_errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a running Kuhhandel server')
+    parser.add_argument('--uri', default='ws://localhost:9876')
+    parser.add_argument('--games', type=int, default=100, help='target number of concurrent games')
+    parser.add_argument('--ramp', type=float, default=10, help='seconds taken to reach the target')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to keep starting games')
+    parser.add_argument('--report', default='load_test_report.json', help='file the JSON report is written to')
+    parser.add_argument('--label', help='name of the server build under test, stored in the report')
+    parser.add_argument('--baseline', help='earlier report to check this run against for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+        help='fraction by which throughput or p95 latency may be worse than the baseline')
+    parser.add_argument('--binary', action='store_true',
+        help='use the binary wire format (game/codec.py) instead of JSON')
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args.uri, args.games, args.ramp, args.duration, args.binary))
+    report['label'] = args.label
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
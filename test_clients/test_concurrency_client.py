@@ -37,7 +37,13 @@ async def client(user_id):
 def handle_msg(msg, user_id, opponent_list):
     """Mocks the appropriate client response to queries"""
 
-    msg_dict = json.loads(msg)
+    response = respond(json.loads(msg), user_id, opponent_list)
+    if response:
+        return json.dumps(response)
+    return None
+
+def respond(msg_dict, user_id, opponent_list):
+    """Returns the response to a decoded message as a {'type', 'payload'} dict, or None"""
 
     # if this is the first state message, get the list of opponent names
     if not opponent_list and msg_dict['type'] == 'state':
@@ -48,35 +54,40 @@ def handle_msg(msg, user_id, opponent_list):
         except KeyError:
             pass
 
+    # acknowledge versioned state so the server can send deltas from here on
+    if msg_dict['type'] == 'state' and 'version' in msg_dict['payload']:
+        return {
+            'type': 'state-ack',
+            'payload': {'version': msg_dict['payload']['version']}
+        }
+
     if msg_dict['type'] == 'query':
 
         if msg_dict['payload'] == 'Please choose auction or challenge':
-            msg = json.dumps({
+            return {
                 'type': 'response',
                 'payload': 'auction'
-            })
+            }
         elif msg_dict['payload'] == {'message': 'Please select the player and card you wish to challenge'}:
-            msg = json.dumps({
+            return {
                 'type': 'challenge',
                 'payload': {
                     'player': random.choice(opponent_list),
                     'card': random.choice(animal_names)
                 }
-            })
+            }
         elif msg_dict['payload'] == {'message': 'Please select payment cards that total at least 0'}:
-            msg = json.dumps({
+            return {
                 'type': 'payment',
                 'payload': {}
-            })
+            }
         elif msg_dict['payload'] == 'Please enter your username':
-            msg = json.dumps({
+            return {
                 'type': 'username',
                 'payload': {'username': user_id}
-            })
-        else:
-            return None
+            }
 
-        return msg
+    return None
 
 if __name__ == '__main__':
     time_delta, game_count = test_concurrent_games()
@@ -1,7 +1,12 @@
 import asyncio
+import json
+import time
 import unittest
 from uuid import uuid4
+from game import codec
+from game.client import ClientDisconnectError
 from game.game import Game
+from game.local import LocalClient, SimpleAgent
 from game.mock_socket import MockSocket
 from game.player import Player
 from game.deck import make_deck
@@ -26,7 +31,51 @@ class TestGame(unittest.TestCase):
         self.assertIsNotNone(self.game.deck)  
 
     def test_push_all(self):
-        pass
+        for _ in range(2):
+            self.game.add_player(Player(MockSocket(time_delay=0.1), uuid4()))
+        run_async(self.game.push_all, {'message': 'hello'}, 'message')
+        for p in self.game.players:
+            run_async(p.client.flush)
+        sent = [p.client._websocket.msg_queue.popleft() for p in self.game.players]
+        self.assertEqual(len(set(sent)), 1)
+        msg = json.loads(sent[0])
+        self.assertEqual(msg['type'], 'message')
+        self.assertEqual(msg['payload'], {'message': 'hello'})
+
+    def test_push_all_encodes_for_each_wire_format(self):
+        sock = MockSocket(time_delay=0)
+        sock.subprotocol = codec.SUBPROTOCOL
+        self.game.add_player(Player(sock, uuid4()))
+        run_async(self.game.push_all, {'message': 'hello'}, 'message')
+        for p in self.game.players:
+            run_async(p.client.flush)
+        json_msg = json.loads(self.game.players[0].client._websocket.msg_queue.popleft())
+        binary_msg = codec.decode(sock.msg_queue.popleft())
+        self.assertEqual(json_msg, binary_msg)
+
+    def test_push_all_sends_concurrently(self):
+        for _ in range(2):
+            self.game.add_player(Player(MockSocket(time_delay=0.1), uuid4()))
+        start = time.monotonic()
+        run_async(self.game.push_all, 'hi', 'message')
+        # queued without waiting on the sockets, which each take 0.1 seconds
+        self.assertLess(time.monotonic() - start, 0.05)
+        start = time.monotonic()
+        for p in self.game.players:
+            run_async(p.client.flush)
+        # written side by side
+        self.assertLess(time.monotonic() - start, 0.25)
+
+    def test_push_all_queues_for_everyone_before_raising_disconnect(self):
+        for _ in range(2):
+            self.game.add_player(Player(MockSocket(time_delay=0), uuid4()))
+        self.game.players[0].client.disconnected = True
+        with self.assertRaises(ClientDisconnectError):
+            run_async(self.game.push_all, 'hi', 'message')
+        for p in self.game.players:
+            run_async(p.client.flush)
+        self.assertEqual([len(p.client._websocket.msg_queue) for p in self.game.players], [0, 1, 1])
+        run_async(self.game.push_all, 'hi', 'message', ignore_disconnects=True)
 
     def test_flip_card(self):
         card = run_async(self.game.flip_card)
@@ -34,8 +83,19 @@ class TestGame(unittest.TestCase):
         self.assertIsNotNone(card.name)
         self.assertIsNotNone(card.value)
 
-    def test_run(self):
-        pass
+    def test_run_waits_for_ready_signal(self):
+        async def start_run():
+            game = Game(num_players=2)
+            task = asyncio.create_task(game.run())
+            await asyncio.sleep(0.01)
+            self.assertFalse(game.started.is_set())
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return game
+
+        game = run_async(start_run)
+        # the complete signal fires however the game ends
+        self.assertTrue(game.is_complete)
 
     def test_flip_card_removes_card_from_deck(self):
         start_count = len(self.game.deck)
@@ -51,6 +111,12 @@ class TestGame(unittest.TestCase):
             card = run_async(self.game.flip_card)
         self.assertEqual(len(self.game.deck), 0)
 
+    def test_same_seed_deals_same_cards(self):
+        game = Game(seed=self.game.seed)
+        self.assertEqual(game.deck, self.game.deck)
+        self.assertEqual(run_async(game.flip_card), run_async(self.game.flip_card))
+        self.assertNotEqual(Game(seed=self.game.seed + 1).deck, self.game.deck)
+
     def test_players_can_trade(self):
         # sufficient to test the can_trade method on Player object
         pass
@@ -69,8 +135,55 @@ class TestGame(unittest.TestCase):
         self.game.update_global_state()
         self.assertIsNotNone(self.game.global_state)
 
-    def test_auction(self):
-        pass
+    def test_auction_without_bids_goes_to_auctioneer(self):
+        game = Game(auction_timeout=0.05)
+        for _ in range(3):
+            game.add_player(Player(MockSocket(time_delay=0), uuid4()))
+        results, bidwinner, payee = run_async(game.auction)
+        self.assertEqual(results['bid'], 0)
+        self.assertEqual(bidwinner, game.players[0])
+        self.assertIsNone(payee)
+
+    def test_auction_accepts_highest_bid(self):
+        game = Game(auction_timeout=0.05)
+        for _ in range(3):
+            game.add_player(Player(MockSocket(time_delay=0), uuid4()))
+        bidder = game.players[1]
+
+        async def bid_during_auction():
+            auction = asyncio.create_task(game.auction())
+            # let the auction open before the bids arrive
+            await asyncio.sleep(0)
+            bidder.client._websocket.push_to_queue([
+                json.dumps({'type': 'bid', 'payload': {'amount': 20}}),
+                json.dumps({'type': 'bid', 'payload': {'amount': 50}}),
+                # more than the bidder holds, so it is ignored
+                json.dumps({'type': 'bid', 'payload': {'amount': 500}})
+            ])
+            await bidder.client.handle_msgs(False)
+            return await auction
+
+        results, bidwinner, payee = run_async(bid_during_auction)
+        self.assertEqual(results['bid'], 50)
+        self.assertEqual(bidwinner, bidder)
+        self.assertEqual(payee, game.players[0])
+        # every player heard the opening bid and both accepted bids
+        sent = [json.loads(m) for m in game.players[2].client._websocket.msg_queue]
+        self.assertEqual([m['payload']['bid'] for m in sent], [0, 20, 50])
+
+    def test_auction_ignores_bids_sent_before_it_opened(self):
+        game = Game(auction_timeout=0.05)
+        for _ in range(3):
+            game.add_player(Player(MockSocket(time_delay=0), uuid4()))
+        auctioneer, bidder = game.players[0], game.players[1]
+        # left over from an earlier auction
+        bidder.client._route_msg({'type': 'bid', 'payload': {'amount': 60}})
+        auctioneer.client._route_msg({'type': 'auctioneer-bid', 'payload': {'amount': 500}})
+        results, bidwinner, payee = run_async(game.auction)
+        self.assertEqual(results['bid'], 0)
+        self.assertEqual(bidwinner, auctioneer)
+        self.assertIsNone(payee)
+        self.assertFalse(auctioneer.buy_option(10))
 
     def test_challenge(self):
         pass
@@ -87,7 +200,7 @@ class TestGame(unittest.TestCase):
         horses = [c for c in make_deck() if c.name == 'horse']
         for p in self.game.players:
             for _ in range(2):
-                p.cards.append(horses.pop())
+                p.add_card(horses.pop())
         self.assertEqual(
             self.game.has_legal_challenge(self.game.players[0]),
             [new_player]
@@ -99,7 +212,7 @@ class TestGame(unittest.TestCase):
         horses = [c for c in make_deck() if c.name == 'horse']
         for p in self.game.players:
             for _ in range(2):
-                p.cards.append(horses.pop())
+                p.add_card(horses.pop())
         how_many_cards_can_be_challenged = self.game.verify_challenge(
             self.game.players[0],
             self.game.players[1],
@@ -115,7 +228,7 @@ class TestGame(unittest.TestCase):
         horses = [c for c in make_deck() if c.name == 'horse']
         for p in self.game.players:
             for _ in range(1):
-                p.cards.append(horses.pop())
+                p.add_card(horses.pop())
         how_many_cards_can_be_challenged = self.game.verify_challenge(
             self.game.players[0],
             self.game.players[1],
@@ -130,8 +243,8 @@ class TestGame(unittest.TestCase):
         self.game.add_player(new_player)
         horses = [c for c in make_deck() if c.name == 'horse']
         dogs = [c for c in make_deck() if c.name == 'dog']
-        self.game.players[0].cards.append(horses.pop())
-        self.game.players[1].cards.append(dogs.pop())
+        self.game.players[0].add_card(horses.pop())
+        self.game.players[1].add_card(dogs.pop())
 
         horse_challenge = self.game.verify_challenge(
             self.game.players[0],
@@ -152,5 +265,65 @@ class TestGame(unittest.TestCase):
         self.assertFalse(dog_challenge)
         self.assertFalse(another_animal_challenge)
 
+    def _game_with_remote_player(self, stand_in):
+        """Returns a game between two SimpleAgents and a websocket client that never answers"""
+
+        game = Game(auction_timeout=0, stand_in=stand_in)
+        for name in ['frodo', 'sam']:
+            player = Player(None, name, client=LocalClient(SimpleAgent(name)))
+            player.name = name
+            game.add_player(player)
+        remote = Player(MockSocket(time_delay=0), 'pippin')
+        remote.name = 'pippin'
+        game.add_player(remote)
+        return game, remote
+
+    def test_stand_in_plays_for_disconnected_player(self):
+        stood_in = []
+
+        def stand_in(player):
+            stood_in.append(player)
+            return LocalClient(SimpleAgent(player.name))
+
+        async def play():
+            game, remote = self._game_with_remote_player(stand_in)
+            task = asyncio.create_task(game.run())
+            # wait until the game is waiting on the remote player, then drop them
+            while not remote.client._waiters:
+                await asyncio.sleep(0.001)
+            remote.client._set_disconnected()
+            await asyncio.wait_for(task, 5)
+            return game, remote
+
+        game, remote = run_async(play)
+        self.assertEqual(stood_in, [remote])
+        self.assertIsInstance(remote.client, LocalClient)
+        self.assertEqual(len(game.deck), 0)
+
+    def test_one_disconnect_gets_one_stand_in(self):
+        stood_in = []
+
+        def stand_in(player):
+            stood_in.append(player)
+            return LocalClient(SimpleAgent(player.name))
+
+        game, remote = self._game_with_remote_player(stand_in)
+        remote.client._set_disconnected()
+        self.assertTrue(run_async(game._stand_in_for, remote))
+        # e.g. a bid waiter on the old client failing after push_all found the disconnect
+        self.assertTrue(run_async(game._stand_in_for, remote))
+        self.assertEqual(stood_in, [remote])
+
+    def test_disconnect_without_stand_in_ends_game(self):
+        async def play():
+            game, remote = self._game_with_remote_player(None)
+            remote.client.disconnected = True
+            await asyncio.wait_for(game.run(), 5)
+            return game
+
+        game = run_async(play)
+        self.assertTrue(game.is_complete)
+        self.assertGreater(len(game.deck), 0)
+
 if __name__ == '__main__':
     unittest.main()
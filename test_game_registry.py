@@ -0,0 +1,252 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from game_registry import GameRegistry
+from game import snapshot
+from game.async_test_helper import run_async
+from game.client import Client
+from game.local import LocalClient, SimpleAgent
+from game.mock_socket import MockSocket
+from game.player import Player
+from game.test_snapshot import start_local_game, wait_for_writes
+
+
+async def end_running_games():
+    """Cancels every game task started by the registry and lets them finish"""
+
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # give the task done callbacks a chance to run
+    await asyncio.sleep(0)
+
+
+class TestGameRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = GameRegistry(num_players=3)
+
+    def test_get_game_creates_game(self):
+        async def join():
+            game = self.registry.get_game()
+            self.assertIn(game, self.registry.open_games)
+            self.assertEqual(self.registry.num_games, 1)
+            await end_running_games()
+
+        run_async(join)
+
+    def test_get_game_fills_open_game_before_creating_another(self):
+        async def join(num_clients):
+            games = [self.registry.get_game() for _ in range(num_clients)]
+            self.assertEqual(len(set(games[:3])), 1)
+            self.assertNotEqual(games[0], games[3])
+            self.assertIn(games[0], self.registry.running_games)
+            self.assertIn(games[3], self.registry.open_games)
+            await end_running_games()
+
+        run_async(join, 4)
+
+    def test_completed_game_removes_itself(self):
+        async def join_and_end():
+            game = self.registry.get_game()
+            # let the game start waiting for players
+            await asyncio.sleep(0)
+            await end_running_games()
+            return game
+
+        game = run_async(join_and_end)
+        self.assertTrue(game.is_complete)
+        self.assertEqual(self.registry.num_games, 0)
+
+    def test_games_are_logged_to_log_dir(self):
+        async def join_and_end():
+            game = self.registry.get_game()
+            await asyncio.sleep(0)
+            await end_running_games()
+            return game
+
+        with tempfile.TemporaryDirectory() as log_dir:
+            self.registry.log_dir = log_dir
+            game = run_async(join_and_end)
+            self.assertTrue(game.events.enabled)
+            self.assertEqual(len(os.listdir(log_dir)), 1)
+
+    def test_restored_game_resumes_when_players_rejoin(self):
+        async def restart_and_rejoin(snapshot_dir, saved_players):
+            registry = GameRegistry(auction_timeout=0, snapshot_dir=snapshot_dir)
+            registry.restore()
+            self.assertEqual(len(registry.running_games), 1)
+            self.assertIsNone(registry.rejoin(Player(None, 'new')))
+            games = []
+            for uuid, name in saved_players:
+                player = Player(None, 'new', client=LocalClient(SimpleAgent(name)))
+                player.rejoin_id = uuid
+                games.append(registry.rejoin(player))
+            game = games[0]
+            self.assertEqual(set(games), {game})
+            self.assertTrue(game.is_ready)
+            await asyncio.wait_for(game.completed.wait(), 5)
+            await asyncio.sleep(0)
+            return game
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            game = run_async(start_local_game, 6)
+            snapshot.Snapshotter(os.path.join(snapshot_dir, 'game.jsonl')).snapshot(game)
+            wait_for_writes()
+            saved_players = [(p.uuid, p.name) for p in game.players]
+
+            restored = run_async(restart_and_rejoin, snapshot_dir, saved_players)
+            wait_for_writes()
+            self.assertEqual(len(restored.deck), 0)
+            self.assertEqual(os.listdir(snapshot_dir), [])
+
+    def test_restored_game_seats_go_to_bots_when_players_never_return(self):
+        async def restart(snapshot_dir):
+            registry = GameRegistry(auction_timeout=0, snapshot_dir=snapshot_dir, reclaim_time=0.01)
+            registry.restore()
+            game, = registry.running_games
+            self.assertFalse(game.is_ready)
+            await asyncio.wait_for(game.completed.wait(), 5)
+            await asyncio.sleep(0)
+            self.assertTrue(all(p.is_bot for p in game.players))
+            self.assertEqual(registry.vacant_seats, {})
+            self.assertEqual(registry.running_games, {})
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            game = run_async(start_local_game, 6)
+            snapshot.Snapshotter(os.path.join(snapshot_dir, 'game.jsonl')).snapshot(game)
+            wait_for_writes()
+            run_async(restart, snapshot_dir)
+            wait_for_writes()
+            self.assertEqual(os.listdir(snapshot_dir), [])
+
+    def test_open_seats_are_filled_with_bots_after_wait(self):
+        async def join():
+            self.registry.bot_wait = 0.01
+            self.registry.auction_timeout = 0
+            game = self.registry.get_game()
+            player = Player(None, 'human', client=LocalClient(SimpleAgent('Bot 1')))
+            player.name = 'Bot 1'
+            game.add_player(player)
+            await asyncio.sleep(0.02)
+            self.assertTrue(game.is_ready)
+            self.assertIn(game, self.registry.running_games)
+            await asyncio.wait_for(game.completed.wait(), 5)
+            return game
+
+        game = run_async(join)
+        players = sorted(game.players, key=lambda p: p.seat)
+        self.assertEqual([p.is_bot for p in players], [False, True, True])
+        self.assertEqual([p.name for p in players], ['Bot 1', 'Bot 2', 'Bot 3'])
+
+    def test_full_game_gets_no_bots(self):
+        async def join():
+            self.registry.bot_wait = 0.01
+            for i in range(3):
+                game = self.registry.get_game()
+                game.add_player(Player(MockSocket(time_delay=0), str(i)))
+            await asyncio.sleep(0.02)
+            await end_running_games()
+            return game
+
+        game = run_async(join)
+        self.assertFalse(any(p.is_bot for p in game.players))
+
+    def test_restored_game_gives_bots_new_agents(self):
+        async def restart_and_rejoin(snapshot_dir, uuid, name):
+            registry = GameRegistry(auction_timeout=0, snapshot_dir=snapshot_dir)
+            registry.restore()
+            game = next(iter(registry.running_games))
+            self.assertEqual(len(registry.vacant_seats), 1)
+            self.assertFalse(game.is_ready)
+            player = Player(None, 'new', client=LocalClient(SimpleAgent(name)))
+            player.rejoin_id = uuid
+            registry.rejoin(player)
+            self.assertTrue(game.is_ready)
+            await asyncio.wait_for(game.completed.wait(), 5)
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            game = run_async(start_local_game, 6)
+            for player in list(game.players)[1:]:
+                player.is_bot = True
+            snapshot.Snapshotter(os.path.join(snapshot_dir, 'game.jsonl')).snapshot(game)
+            wait_for_writes()
+            human = game.players[0]
+            run_async(restart_and_rejoin, snapshot_dir, human.uuid, human.name)
+
+    def test_disconnected_player_can_reclaim_seat_from_bot(self):
+        async def disconnect_and_rejoin():
+            registry = GameRegistry(reclaim_time=10)
+            game = registry.get_game()
+            player = Player(MockSocket(time_delay=0), 'frodo-id')
+            player.name = 'frodo'
+            game.add_player(player)
+            bot_client = game.stand_in(player)
+            player.replace_client(bot_client)
+            self.assertEqual(bot_client.agent.name, 'frodo')
+
+            returning = Player(MockSocket(time_delay=0), 'new')
+            returning.rejoin_id = 'frodo-id'
+            self.assertIs(registry.rejoin(returning), game)
+            self.assertIs(player.client, returning.client)
+            await end_running_games()
+
+        run_async(disconnect_and_rejoin)
+
+    def test_seat_goes_to_bot_after_reclaim_time(self):
+        async def disconnect_twice():
+            registry = GameRegistry(reclaim_time=10)
+            game = registry.get_game()
+            player = Player(MockSocket(time_delay=0), 'frodo-id')
+            player.rejoin_id = 'frodo-id'
+            game.add_player(player)
+            player.replace_client(game.stand_in(player))
+            first_seat = registry.vacant_seats['frodo-id']
+            # back and gone again, so the first disconnect's timer doesn't count
+            self.assertIs(registry.rejoin(player), game)
+            player.replace_client(game.stand_in(player))
+            # as the reclaim timers would, without waiting for them
+            registry._give_seat_to_bot(first_seat)
+            self.assertFalse(player.is_bot)
+            registry._give_seat_to_bot(registry.vacant_seats['frodo-id'])
+            self.assertTrue(player.is_bot)
+            self.assertIsNone(registry.rejoin(player))
+            await end_running_games()
+
+        run_async(disconnect_twice)
+
+    def test_games_end_on_disconnect_without_reclaim_time(self):
+        async def join():
+            game = self.registry.get_game()
+            await end_running_games()
+            return game
+
+        self.assertIsNone(run_async(join).stand_in)
+
+    def test_client_resumes_session_with_token(self):
+        async def drop_and_resume():
+            registry = GameRegistry(resume_time=10)
+            game = registry.get_game()
+            player = Player(None, 'frodo-id', client=Client(MockSocket(time_delay=0), resume_time=10))
+            game.add_player(player)
+            registry.keep_session(game, player)
+            await player.client.send_msg('missed', 'message')
+
+            returning = Player(MockSocket(time_delay=0), 'new')
+            self.assertIsNone(registry.resume(returning, MockSocket()))
+            returning.resume_request = ('wrong token', 0)
+            self.assertIsNone(registry.resume(returning, MockSocket()))
+            returning.resume_request = (player.resume_token, 0)
+            new_sock = MockSocket(time_delay=0)
+            self.assertEqual(registry.resume(returning, new_sock), (game, player, True))
+            await player.client.flush()
+            self.assertEqual(len(new_sock.msg_queue), 2)
+            await end_running_games()
+            self.assertEqual(registry.sessions, {})
+
+        run_async(drop_and_resume)
+
+if __name__ == '__main__':
+    unittest.main()